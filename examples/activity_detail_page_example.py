@@ -27,6 +27,7 @@ if PROJECT_ROOT not in sys.path:
 
 from pace_view.data_cleaning import DataCleaner
 from pace_view.config import get_weather_api_key
+from pace_view.activity_cache import ActivityCache
 from pace_view.data_parsing import DataParser
 
 LOGGER = logging.getLogger(__name__)
@@ -213,7 +214,7 @@ def find_example_tcx_file(data_dir: str, preferred_file: str = DEFAULT_TCX_FILE)
 
 
 def build_activity_payload_from_single_tcx(data_dir: str) -> dict[str, Any]:
-    parser = DataParser()
+    parser = DataParser(cache=ActivityCache.for_folder(data_dir))
     cleaner = DataCleaner()
 
     source_file, file_path = find_example_tcx_file(data_dir)
@@ -74,12 +74,6 @@ def parse_args():
         default=None,
         help="Optional Visual Crossing API key for weather enrichment.",
     )
-    parser.add_argument(
-        "--time-delta",
-        type=int,
-        default=1,
-        help="Weather sampling delta used by DataParser.",
-    )
     return parser.parse_args()
 
 
@@ -102,7 +96,6 @@ def main():
     trainer = ContextTrainer(
         history_folder=history_folder,
         weather_api_key=weather_api_key,
-        time_delta=args.time_delta,
     )
 
     trainer.fit()
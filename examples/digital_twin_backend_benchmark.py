@@ -0,0 +1,109 @@
+"""Compare digital twin regressor backends on the same ride history.
+
+For every backend in `pace_view.digital_twin.BACKENDS` this reports train time,
+predict throughput over all per-second rows, pickled model size, and R2 on
+held-out activities.
+
+Run:
+    python examples/digital_twin_backend_benchmark.py
+    python examples/digital_twin_backend_benchmark.py --history-folder path/to/tcx --holdout 0.3
+"""
+
+import argparse
+import os
+import pickle
+import sys
+import time
+
+CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.abspath(os.path.join(CURRENT_DIR, ".."))
+DEFAULT_HISTORY_FOLDER = os.path.join(CURRENT_DIR, "data")
+
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+import pandas as pd
+from sklearn.metrics import r2_score
+
+from pace_view.core import ContextTrainer
+from pace_view.digital_twin import BACKENDS, DigitalTwinModel
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Digital twin backend benchmark")
+    parser.add_argument(
+        "--history-folder",
+        default=DEFAULT_HISTORY_FOLDER,
+        help="Folder with historical TCX files.",
+    )
+    parser.add_argument(
+        "--holdout",
+        type=float,
+        default=0.25,
+        help="Fraction of activities (by file order) held out for R2.",
+    )
+    parser.add_argument(
+        "--backends",
+        nargs="*",
+        default=sorted(BACKENDS),
+        help="Backends to compare.",
+    )
+    parser.add_argument(
+        "--n-workers",
+        type=int,
+        default=1,
+        help="Worker processes for history ingestion.",
+    )
+    return parser.parse_args()
+
+
+def load_history(history_folder: str, n_workers: int):
+    trainer = ContextTrainer(history_folder=history_folder, n_workers=n_workers)
+    return [df for _, df in trainer._load_history(trainer._history_paths())]
+
+
+def benchmark_backend(backend: str, train_df: pd.DataFrame, test_df: pd.DataFrame, all_df: pd.DataFrame) -> dict:
+    model = DigitalTwinModel(backend=backend)
+
+    start = time.perf_counter()
+    model.train(train_df)
+    train_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    model.predict(all_df)
+    predict_s = time.perf_counter() - start
+
+    test_clean = test_df.dropna(subset=model.features + ["hr"])
+    r2 = r2_score(test_clean["hr"], model.predict(test_clean)) if len(test_clean) > 1 else float("nan")
+
+    return {
+        "backend": backend,
+        "train_s": train_s,
+        "predict_rows_per_s": len(all_df) / predict_s if predict_s > 0 else float("inf"),
+        "size_kb": len(pickle.dumps(model.model)) / 1024,
+        "r2_holdout": r2,
+    }
+
+
+def main():
+    args = parse_args()
+    history_folder = os.path.abspath(args.history_folder)
+    dfs = load_history(history_folder, args.n_workers)
+    if len(dfs) < 2:
+        raise ValueError("Need at least two usable activities for a hold-out split.")
+
+    n_test = max(1, int(round(len(dfs) * args.holdout)))
+    train_df = pd.concat(dfs[:-n_test], ignore_index=True)
+    test_df = pd.concat(dfs[-n_test:], ignore_index=True)
+    all_df = pd.concat(dfs, ignore_index=True)
+
+    print(f"History: {len(dfs)} activities, {len(all_df):,} rows ({n_test} activities held out)")
+    results = [benchmark_backend(name, train_df, test_df, all_df) for name in args.backends]
+
+    table = pd.DataFrame(results).set_index("backend")
+    with pd.option_context("display.float_format", "{:,.3f}".format):
+        print(table)
+
+
+if __name__ == "__main__":
+    main()
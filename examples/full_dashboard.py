@@ -1,6 +1,5 @@
 """Standalone dashboard entrypoint for PACE-VIEW."""
 
-import logging
 import os
 import sys
 
@@ -15,10 +14,12 @@ import pandas as pd
 from dash import Dash, html, dcc, Input, Output
 from flask import Flask, abort, redirect, render_template
 from pace_view.config import get_weather_api_key
+from pace_view.activity_cache import ActivityCache
 from pace_view.data_parsing import DataParser
 from pace_view.data_cleaning import DataCleaner
-
-LOGGER = logging.getLogger(__name__)
+from pace_view.figure_cache import FigureCache, data_version
+from pace_view.tcx_sources import list_tcx_sources, source_exists, source_name
+from pace_view.zone_index import ZoneIndex
 
 
 def format_metric(value, suffix="", precision=1):
@@ -109,18 +110,11 @@ def build_activity_table(total_summary: pd.DataFrame) -> pd.DataFrame:
     return activity_table
 
 
-def load_exercises_with_filenames(parser: DataParser, directory_name: str):
-    file_names = sorted([f for f in os.listdir(directory_name) if f.lower().endswith(".tcx")])
-    exercises = []
-    for file_name in file_names:
-        file_path = os.path.join(directory_name, file_name)
-        try:
-            exercise = parser.parse_tcx_file(file_path)
-            if exercise is not None:
-                exercises.append((file_name, exercise))
-        except Exception as exc:
-            LOGGER.warning("Skipping unreadable file %s: %s", file_name, exc)
-    return exercises, file_names
+def load_activity_summaries(cleaner: DataCleaner, directory_name: str):
+    """Summarize every TCX ride in the folder (plain, compressed, or zipped) without building full trackpoint frames."""
+    file_paths = list_tcx_sources(directory_name)
+    file_names = [source_name(file_path) for file_path in file_paths]
+    return cleaner.build_dashboard_from_files(file_paths), file_names
 
 
 def get_triggered_input_id() -> str:
@@ -292,7 +286,7 @@ def create_flask_server() -> Flask:
 
             if isinstance(source_file, str) and source_file:
                 file_path = os.path.join(data_directory, source_file)
-                if os.path.exists(file_path):
+                if source_exists(file_path):
                     report, explain_error = get_context_activity_report(context_state, file_path)
                     if explain_error and context_error is None:
                         context_error = explain_error
@@ -352,11 +346,9 @@ def create_dash_app(server: Flask) -> Dash:
 
     # Load and preprocess activity data once during app bootstrap.
     directory_name = os.path.join(PROJECT_ROOT,"examples", "data")
-    parser = DataParser()
-    cleaner = DataCleaner()
-    exercises, file_names = load_exercises_with_filenames(parser, directory_name)
-
-    total_summary = cleaner.build_dashboard(exercises)
+    parser = DataParser(cache=ActivityCache.for_folder(directory_name))
+    cleaner = DataCleaner(parser)
+    total_summary, file_names = load_activity_summaries(cleaner, directory_name)
     activity_table = build_activity_table(total_summary)
     total_summary_with_ids = total_summary.merge(
         activity_table[["activity_id", "start_time", "source_file"]],
@@ -402,16 +394,33 @@ def create_dash_app(server: Flask) -> Dash:
         fig.update_traces(line=dict(width=3), selector=dict(mode="lines"))
         return fig
 
-    def themed_figures(period: str):
-        fig1, fig2, fig3, fig4 = cleaner.return_figures(total_summary_with_ids, period)
-        return (
-            apply_theme(fig1),
-            apply_theme(fig2),
-            apply_theme(fig3),
-            apply_theme(fig4),
+    # Themed figures are memoized per (data version, figure, period/window), so
+    # repeated button clicks are served without recomputing statistics.
+    figure_cache = FigureCache(theme=apply_theme)
+    summary_version = data_version(total_summary_with_ids)
+    zone_index = ZoneIndex.from_summary(total_summary_with_ids)
+
+    def zone_mix_figure(period: str):
+        return figure_cache.get(
+            summary_version, "zone_mix", period,
+            lambda: cleaner.zone_mix_figure(total_summary_with_ids, period, zone_index=zone_index),
         )
 
-    fig1, fig2, _, fig4 = themed_figures("7D")
+    def efficiency_figure(window_days: int):
+        return figure_cache.get(
+            summary_version, "efficiency", window_days,
+            lambda: cleaner.efficiency_figure(total_summary_with_ids, window_days),
+        )
+
+    def heatmap_figure():
+        return figure_cache.get(
+            summary_version, "hr_heatmap", None,
+            lambda: cleaner.hr_heatmap_figure(total_summary_with_ids),
+        )
+
+    fig1 = zone_mix_figure("7D")
+    fig2 = efficiency_figure(90)
+    fig4 = heatmap_figure()
 
     total_sessions = int(len(total_summary))
     total_distance_km = total_summary["distance_km"].sum()
@@ -775,7 +784,7 @@ def create_dash_app(server: Flask) -> Dash:
             label = "Aggregated by 7 days"
             active = "week"
 
-        fig1, _, _, _ = themed_figures(period)
+        fig1 = zone_mix_figure(period)
 
         week_class = "range-btn active" if active == "week" else "range-btn"
         month_class = "range-btn active" if active == "month" else "range-btn"
@@ -809,10 +818,7 @@ def create_dash_app(server: Flask) -> Dash:
             label = "Rolling trend: 90 days"
             active = "90"
 
-        # period only affects fig1, so we keep a fixed value while updating fig2.
-        _, fig2, _, _ = cleaner.return_figures(total_summary_with_ids, "7D", window_days)
-
-        fig2 = apply_theme(fig2)
+        fig2 = efficiency_figure(window_days)
 
         class_90 = "range-btn active" if active == "90" else "range-btn"
         class_180 = "range-btn active" if active == "180" else "range-btn"
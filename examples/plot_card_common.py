@@ -6,7 +6,6 @@ This module centralizes:
 - common Plotly styling used by all card examples
 """
 
-import logging
 import os
 import sys
 
@@ -20,32 +19,16 @@ if PROJECT_ROOT not in sys.path:
     sys.path.insert(0, PROJECT_ROOT)
 
 from pace_view.data_cleaning import DataCleaner
+from pace_view.activity_cache import ActivityCache
 from pace_view.data_parsing import DataParser
-
-LOGGER = logging.getLogger(__name__)
-
-
-def load_exercises_with_filenames(parser: DataParser, directory_name: str):
-    """Load readable TCX files and keep `(source_file, exercise)` tuples."""
-    file_names = sorted([f for f in os.listdir(directory_name) if f.lower().endswith(".tcx")])
-    exercises = []
-    for file_name in file_names:
-        file_path = os.path.join(directory_name, file_name)
-        try:
-            exercise = parser.parse_tcx_file(file_path)
-            if exercise is not None:
-                exercises.append((file_name, exercise))
-        except Exception as exc:
-            LOGGER.warning("Skipping unreadable file %s: %s", file_name, exc)
-    return exercises
+from pace_view.tcx_sources import list_tcx_sources
 
 
 def load_dashboard_summary():
     """Return the shared cleaner instance and prepared dashboard summary dataframe."""
-    parser = DataParser()
-    cleaner = DataCleaner()
-    exercises = load_exercises_with_filenames(parser, DATA_DIR)
-    total_summary = cleaner.build_dashboard(exercises)
+    parser = DataParser(cache=ActivityCache.for_folder(DATA_DIR))
+    cleaner = DataCleaner(parser)
+    total_summary = cleaner.build_dashboard_from_files(list_tcx_sources(DATA_DIR))
     return cleaner, total_summary
 
 
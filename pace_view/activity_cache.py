@@ -0,0 +1,197 @@
+"""
+Content-addressed on-disk cache for parsed and cleaned activities.
+"""
+
+import dataclasses
+import hashlib
+import json
+import os
+import numpy as np
+import pandas as pd
+from .data_parsing import TCXActivity
+from .tcx_sources import source_exists, split_archive_path, zip_member_key
+from .utils import CACHE_DIRNAME, atomic_write
+
+CACHE_VERSION = 1
+
+
+class ActivityCache:
+    """
+    Stores per-file results as columnar `.npz` files keyed by content hash.
+
+    A small pointer file per source path records (size, mtime, content hash). When
+    the stat fields still match, the content hash is reused without reading the
+    file; otherwise the file is re-hashed and entries of the old content are dropped.
+    Zip archive members use the archive's stat fields and are hashed from their
+    directory entry (name, CRC, size).
+    """
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+        self.pointer_dir = os.path.join(cache_dir, "paths")
+        self.data_dir = os.path.join(cache_dir, "data")
+
+    @classmethod
+    def for_folder(cls, folder):
+        """
+        Create a cache that lives next to the given activity folder.
+        """
+        return cls(os.path.join(folder, CACHE_DIRNAME))
+
+    def _pointer_path(self, filepath):
+        digest = hashlib.sha1(os.path.abspath(filepath).encode("utf-8")).hexdigest()
+        return os.path.join(self.pointer_dir, f"{digest}.json")
+
+    def _entry_path(self, content_hash, kind):
+        return os.path.join(self.data_dir, f"{content_hash}.{kind}.v{CACHE_VERSION}.npz")
+
+    def _hash_file(self, filepath):
+        digest = hashlib.blake2b(digest_size=20)
+        member_key = zip_member_key(filepath)
+        if member_key is not None:
+            # Archive members are identified by the zip directory entry without decompressing them.
+            digest.update(member_key.encode("utf-8"))
+            return digest.hexdigest()
+        with open(filepath, "rb") as handle:
+            for block in iter(lambda: handle.read(1 << 20), b""):
+                digest.update(block)
+        return digest.hexdigest()
+
+    def _read_pointer(self, filepath):
+        try:
+            with open(self._pointer_path(filepath), encoding="utf-8") as handle:
+                return json.load(handle)
+        except (OSError, ValueError):
+            return None
+
+    def _drop_content(self, content_hash):
+        for name in os.listdir(self.data_dir):
+            if name.startswith(f"{content_hash}."):
+                os.remove(os.path.join(self.data_dir, name))
+
+    def content_key(self, filepath):
+        """
+        Return the content hash for a file, re-hashing only when size or mtime changed.
+        """
+        stat = os.stat(split_archive_path(filepath)[0])
+        pointer = self._read_pointer(filepath)
+        if pointer and pointer.get("size") == stat.st_size and pointer.get("mtime_ns") == stat.st_mtime_ns:
+            return pointer["hash"]
+
+        content_hash = self._hash_file(filepath)
+        os.makedirs(self.pointer_dir, exist_ok=True)
+        os.makedirs(self.data_dir, exist_ok=True)
+        if pointer and pointer.get("hash") != content_hash:
+            self._drop_content(pointer["hash"])  # Stale entries of the previous file content
+
+        record = {
+            "path": os.path.abspath(filepath),
+            "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+            "hash": content_hash,
+        }
+
+        def write(tmp_path):
+            with open(tmp_path, "w", encoding="utf-8") as handle:
+                json.dump(record, handle)
+
+        atomic_write(self._pointer_path(filepath), write)
+        return content_hash
+
+    def load_arrays(self, filepath, kind):
+        """
+        Return the cached arrays for (file, kind) or None on a miss.
+        """
+        path = self._entry_path(self.content_key(filepath), kind)
+        if not os.path.exists(path):
+            return None
+        try:
+            with np.load(path, allow_pickle=False) as data:
+                return {key: data[key] for key in data.files}
+        except (OSError, ValueError):
+            return None
+
+    def store_arrays(self, filepath, kind, arrays):
+        """
+        Store a dict of NumPy arrays for (file, kind).
+        """
+        path = self._entry_path(self.content_key(filepath), kind)
+
+        def write(tmp_path):
+            with open(tmp_path, "wb") as handle:
+                np.savez(handle, **arrays)
+
+        atomic_write(path, write)
+
+    def load_frame(self, filepath, kind="frame"):
+        """
+        Return a cached dataframe or None on a miss.
+        """
+        arrays = self.load_arrays(filepath, kind)
+        if arrays is None:
+            return None
+        columns = [str(c) for c in arrays.pop("__columns__")]
+        return pd.DataFrame({c: arrays[c] for c in columns}, columns=columns)
+
+    def store_frame(self, filepath, df, kind="frame"):
+        """
+        Store a dataframe with numeric/datetime columns.
+        """
+        arrays = {c: df[c].to_numpy() for c in df.columns}
+        arrays["__columns__"] = np.array(list(df.columns), dtype=str)
+        self.store_arrays(filepath, kind, arrays)
+
+    def load_activity(self, filepath):
+        """
+        Return a cached `TCXActivity` or None on a miss.
+        """
+        arrays = self.load_arrays(filepath, "activity")
+        if arrays is None:
+            return None
+
+        values = {}
+        for f in dataclasses.fields(TCXActivity):
+            value = arrays[f.name]
+            if value.ndim == 0:
+                value = value.item()
+                if f.name in ("start_time", "end_time"):
+                    value = None if value is None else pd.Timestamp(value)
+                elif isinstance(value, float) and np.isnan(value):
+                    value = None
+                elif value == "":
+                    value = None
+            values[f.name] = value
+        return TCXActivity(**values)
+
+    def store_activity(self, filepath, activity):
+        """
+        Store a `TCXActivity` (arrays plus scalar summary fields).
+        """
+        arrays = {}
+        for f in dataclasses.fields(TCXActivity):
+            value = getattr(activity, f.name)
+            if f.name in ("start_time", "end_time"):
+                value = np.datetime64(value, "us") if value is not None else np.datetime64("NaT", "us")
+            elif value is None:
+                value = "" if f.name == "activity_type" else np.nan
+            arrays[f.name] = np.asarray(value)
+        self.store_arrays(filepath, "activity", arrays)
+
+    def prune(self):
+        """
+        Remove entries whose source files no longer exist.
+        """
+        if not os.path.isdir(self.pointer_dir):
+            return 0
+        removed = 0
+        for name in os.listdir(self.pointer_dir):
+            pointer_path = os.path.join(self.pointer_dir, name)
+            try:
+                with open(pointer_path, encoding="utf-8") as handle:
+                    pointer = json.load(handle)
+            except (OSError, ValueError):
+                continue
+            if not source_exists(pointer.get("path", "")):
+                self._drop_content(pointer["hash"])
+                os.remove(pointer_path)
+                removed += 1
+        return removed
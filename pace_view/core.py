@@ -3,86 +3,361 @@ Orchestrates the end-to-end contextual intelligence flow for cycling data from T
 """
 
 import os
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
 import pandas as pd
+from threadpoolctl import threadpool_limits
+from .activity_cache import ActivityCache
 from .data_parsing import DataParser
+from .history_store import HistoryStore
 from .data_cleaning import DataCleaner
 from .physics import PhysicsEngine
 from .digital_twin import DigitalTwinModel
 from .counterfactual import CounterfactualAnalyzer
 from .rationale import RationaleGenerator
 from .mining import PatternMiner
+from .tcx_sources import list_tcx_sources, source_exists, source_name, split_archive_path
+
+_INGEST_PIPELINE = None
+MODEL_FILENAME = "digital_twin.joblib"
+
+
+def _process_activity(parser, cleaner, engine, filepath, is_training=False, compact=False, physics=True):
+    """
+    Parse, clean, and enrich a TCX file with physics and weather features.
+    Cleaned frames with neutral weather are served from the parser's cache when available.
+    With ``compact`` the result uses the compact schema (see `DataCleaner.compact_frame`).
+    Without ``physics`` the cleaned frame is returned as is, for a later batch physics pass.
+    """
+    cache = parser.cache if not parser.uses_weather(is_training) else None
+    df = cache.load_frame(filepath) if cache is not None else None
+
+    if df is None:
+        parsed = parser.parse_file(filepath, is_training=is_training)
+        if parsed is None:
+            return None
+
+        act, weather_data = parsed
+        df = cleaner.to_dataframe(act, weather_data)
+        if cache is not None:
+            cache.store_frame(filepath, df)
+
+    if not physics:
+        return df
+    df = engine.calculate_virtual_power(df)
+    if compact:
+        df = cleaner.compact_frame(df, drop_columns=engine.scratch_columns)
+    return df
+
+
+def _ingest_chunk(parser, cleaner, engine, paths, compact=False):
+    """
+    Process a few history files together: parse and clean each, add physics with one
+    batch pass over the chunk (see `PhysicsEngine.calculate_rides`), then compact each
+    ride. Only one chunk of rides is ever held at full precision. Returns one
+    dataframe per path, None where the file cannot be used.
+    """
+    frames = []
+    for path in paths:
+        try:
+            df = _process_activity(parser, cleaner, engine, path, is_training=True, physics=False)
+        except Exception:
+            df = None
+        frames.append(df if df is not None and len(df) > 0 else None)
+
+    engine.calculate_rides([df for df in frames if df is not None])
+    if compact:
+        frames = [
+            None if df is None else cleaner.compact_frame(df, drop_columns=engine.scratch_columns) for df in frames
+        ]
+    return frames
+
+
+def _init_ingest_worker(parser, cleaner, engine, compact=False):
+    """
+    Set up a pool worker with its own pipeline and a single BLAS/OpenMP thread.
+    """
+    global _INGEST_PIPELINE
+    # Each process already owns one core; nested native threads would oversubscribe.
+    threadpool_limits(limits=1)
+    _INGEST_PIPELINE = (parser, cleaner, engine, compact)
+
+
+def _ingest_history_chunk(paths):
+    """
+    Pool task: process one chunk of history files (see `_ingest_chunk`).
+    """
+    parser, cleaner, engine, compact = _INGEST_PIPELINE
+    return _ingest_chunk(parser, cleaner, engine, paths, compact=compact)
 
 
 class ContextTrainer:
     """
     High-level API that ties parsing, physics, digital twin, and XAI together.
+
+    Set ``n_workers`` > 1 (or -1 for all cores) to ingest the history with a
+    process pool; ``chunk_size`` controls how many files each task carries and each
+    batch physics pass covers, which bounds the rides held at full precision at once.
+    Parsed activities are cached under ``cache_dir`` (default: a hidden folder
+    inside ``history_folder``) unless ``use_cache`` is False. The trained model is
+    saved to ``model_path`` and reloaded by `fit` while the history is unchanged.
+    ``backend`` picks the digital twin regressor (see `digital_twin.BACKENDS`).
+    ``compact`` keeps the history in the compact schema (float32 sensors, epoch-second
+    timestamps, categorical activity ids, no physics scratch columns) to cut memory.
+    ``weather_provider`` replaces the VisualCrossing API as the weather source (see `weather`).
+    ``time_delta`` is deprecated and ignored: weather samples are hourly.
     """
-    def __init__(self, history_folder, weather_api_key=None, time_delta=1):
+    def __init__(
+        self,
+        history_folder,
+        weather_api_key=None,
+        time_delta=None,
+        n_workers=1,
+        chunk_size=4,
+        use_cache=True,
+        cache_dir=None,
+        model_path=None,
+        backend="random_forest",
+        compact=False,
+        weather_provider=None,
+    ):
+        if time_delta is not None:
+            warnings.warn(
+                "time_delta is deprecated and ignored; weather is sampled hourly.", DeprecationWarning, stacklevel=2
+            )
         self.history_folder = history_folder
-        self.parser = DataParser(weather_api_key=weather_api_key, time_delta=time_delta)
+        self.compact = compact
+        self.n_workers = n_workers
+        self.chunk_size = chunk_size
+        self.cache = None
+        if use_cache:
+            self.cache = ActivityCache(cache_dir) if cache_dir else ActivityCache.for_folder(history_folder)
+        self.parser = DataParser(weather_api_key=weather_api_key, cache=self.cache, weather_provider=weather_provider)
         self.cleaner = DataCleaner(self.parser)
         self.engine = PhysicsEngine()
-        self.model = DigitalTwinModel()
+        self.model = DigitalTwinModel(backend=backend)
         self.counterfactual = CounterfactualAnalyzer(self.model)
         self.rationale = RationaleGenerator()
         self.miner = PatternMiner()
+        self.store = HistoryStore.for_folder(history_folder)
+        self.model_path = model_path or os.path.join(history_folder, MODEL_FILENAME)
 
     def _process_file(self, filepath, is_training=False):
         """
         Parse, clean, and enrich a TCX file with physics and weather features.
         """
-        parsed = self.parser.parse_file(filepath, is_training=is_training)
-        if parsed is None:
-            return None
+        return _process_activity(
+            self.parser, self.cleaner, self.engine, filepath, is_training=is_training, compact=self.compact
+        )
 
-        act, weather_data = parsed
-        df = self.cleaner.to_dataframe(act, weather_data)
+    def _resolve_workers(self, n_files):
+        """
+        Clamp the configured worker count to the available cores and files.
+        """
+        cpu_count = os.cpu_count() or 1
+        workers = cpu_count if self.n_workers in (None, -1) else int(self.n_workers)
+        return max(1, min(workers, cpu_count, n_files))
+
+    def _load_history(self, paths):
+        """
+        Process history files serially or in a process pool, ``chunk_size`` files at a
+        time, preserving file order. Returns a list of (path, dataframe) for the usable activities.
+        """
+        workers = self._resolve_workers(len(paths))
+        size = max(1, int(self.chunk_size))
+        chunks = [paths[i:i + size] for i in range(0, len(paths), size)]
+        dfs = []
+
+        def collect(chunk, frames, done):
+            for path, df in zip(chunk, frames):
+                if df is not None:
+                    dfs.append((path, df))
+            if done // 10 != (done - len(chunk)) // 10: print(f"  Processed {done}/{len(paths)} activities...")
 
-        return self.engine.calculate_virtual_power(df)
+        if workers == 1:
+            done = 0
+            for chunk in chunks:
+                done += len(chunk)
+                collect(chunk, _ingest_chunk(self.parser, self.cleaner, self.engine, chunk, compact=self.compact), done)
+            return dfs
 
-    def fit(self):
+        print(f"  Using {workers} worker processes (chunk size {size})...")
+        # The pool is shut down before returning, so the forest's n_jobs=-1 gets the cores back.
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=_init_ingest_worker,
+            initargs=(self.parser, self.cleaner, self.engine, self.compact),
+        ) as pool:
+            done = 0
+            for chunk, frames in zip(chunks, pool.map(_ingest_history_chunk, chunks)):
+                done += len(chunk)
+                collect(chunk, frames, done)
+        return dfs
+
+    def _concat_history(self, history):
+        """
+        Concatenate (path, dataframe) pairs; compact mode tags rows with a categorical activity id.
+        """
+        if self.compact:
+            names = list(dict.fromkeys(source_name(path) for path, _ in history))
+            for path, df in history:
+                codes = np.full(len(df), names.index(source_name(path)))
+                df["activity_id"] = pd.Categorical.from_codes(codes, categories=names)
+        return pd.concat([df for _, df in history], ignore_index=True)
+
+    def _store_partitions(self, spans, analyzed):
+        """
+        Write one history-store partition per activity from the analyzed concatenation (one manifest write).
+        """
+        if self.compact:
+            analyzed = analyzed.drop(columns="activity_id")  # The partition id already names the activity
+            for col in ("hr_predicted", "drift"):
+                analyzed[col] = analyzed[col].astype(np.float32)
+        offsets = np.concatenate(([0], np.cumsum([rows for _, rows in spans], dtype=np.int64)))
+        self.store.extend(
+            (name, analyzed.iloc[offsets[i]:offsets[i + 1]]) for i, (name, _) in enumerate(spans)
+        )
+
+    def _history_paths(self):
+        """
+        Return the TCX inputs of the history folder in sorted order (see `tcx_sources.list_tcx_sources`).
+        """
+        return list_tcx_sources(self.history_folder)
+
+    def prefetch_weather(self, **kwargs):
+        """
+        Fill the weather cache for every ride in the history folder before analysis
+        (options as in `weather.prefetch`, e.g. ``max_workers`` and ``rate_limit``).
+        """
+        return self.parser.prefetch_weather(self._history_paths(), **kwargs)
+
+    def _training_key(self, paths):
+        """
+        Describe the training inputs: each file's content identity plus physics settings.
+        """
+        files = []
+        for path in paths:
+            if self.cache is not None:
+                identity = self.cache.content_key(path)
+            else:
+                stat = os.stat(split_archive_path(path)[0])
+                identity = f"{stat.st_size}:{stat.st_mtime_ns}"
+            files.append([source_name(path), identity])
+        key = {"files": sorted(files), "physics": vars(self.engine)}
+        if self.compact:
+            key["compact"] = True
+        return key
+
+    def _load_saved_model(self, fingerprint):
+        """
+        Load the saved model if it was trained on the same inputs; return True on success.
+        """
+        if not os.path.exists(self.model_path) or not self.store.exists():
+            return False
+        try:
+            return self.model.load(self.model_path, expected_fingerprint=fingerprint) is not None
+        except Exception as e:
+            print(f"Could not load saved model: {e}")
+            return False
+
+    def fit(self, force=False):
         """
         Train the Digital Twin model on all historical TCX files. This reflects component 2 of the architecture for environmental quantification.
+        Reuses the saved model when the history, features, and hyperparameters are unchanged (unless ``force``).
         """
         print(f"Loading history from {self.history_folder}...")
-        files = [f for f in os.listdir(self.history_folder) if f.endswith('.tcx')]
-        dfs = []
-        for i, f in enumerate(files):
-            try:
-                path = os.path.join(self.history_folder, f)
-                df = self._process_file(path, is_training=True)
-                if df is not None and len(df) > 0:
-                    dfs.append(df)
-                if i % 10 == 0: print(f"  Processed {i}/{len(files)} activities...")
-            except: pass 
+        paths = self._history_paths()
+
+        fingerprint = self.model.fingerprint(self._training_key(paths))
+        if not force and self._load_saved_model(fingerprint):
+            print(f"History unchanged; loaded saved model from {self.model_path}")
+            return
+
+        history = self._load_history(paths)
+        self.parser.save_weather()
 
-        if not dfs: raise Exception("No valid TCX files found.")
+        if not history: raise Exception("No valid TCX files found.")
 
         print("Training Physiological Model...")
-        full_history = pd.concat(dfs, ignore_index=True)
+        full_history = self._concat_history(history)
+        spans = [(source_name(path), len(df)) for path, df in history]
+        del history  # Keep only the concatenated copy alive
         score = self.model.train(full_history)
         print(f"Model Trained! Accuracy (R2): {score:.2f}")
         
-        print("Caching history for pattern mining...")
+        print("Storing history for pattern mining...")
         
         full_history_analyzed = self.model.predict_drift(full_history) # Add 'drift' column to history (for miner)
-        
-        cache_path = os.path.join(self.history_folder, "history_cache.csv") # Save cached history for pattern mining
-        full_history_analyzed.to_csv(cache_path, index=False)
-        print(f"History cache saved to: {cache_path}")
+        del full_history
+
+        # The model changed, so every partition's drift is rewritten.
+        self.store.clear()
+        self._store_partitions(spans, full_history_analyzed)
+        print(f"History store saved to: {self.store.root}")
+
+        self.model.save(self.model_path, fingerprint=fingerprint)
+        print(f"Model saved to: {self.model_path}")
+
+    def update(self, new_files, n_new_trees=10):
+        """
+        Add new rides without retraining on the whole history.
+        New files are ingested alone, the forest grows by ``n_new_trees`` warm-started trees
+        fitted on them, and only their drift partitions are appended to the history store.
+        """
+        if not self.model.is_trained:
+            if not os.path.exists(self.model_path) or not self.store.exists():
+                print("No trained model found; running a full fit.")
+                return self.fit()
+            # Only warm-start a saved model built with the configured backend and hyperparameters.
+            backend, configured = self.model.backend, self.model.fingerprint(None)
+            self.model.load(self.model_path)
+            if self.model.fingerprint(None) != configured:
+                print(f"Saved model ({self.model.backend!r}) does not match the configured {backend!r} backend; running a full fit.")
+                self.model = DigitalTwinModel(backend=backend)
+                return self.fit(force=True)
+        if not self.model.supports_update:
+            print(f"Backend {self.model.backend!r} cannot be updated incrementally; running a full fit.")
+            return self.fit(force=True)
+
+        new_paths = [f if os.path.isabs(f) or source_exists(f) else os.path.join(self.history_folder, f) for f in new_files]
+        print(f"Updating with {len(new_paths)} new activities...")
+        history = self._load_history(new_paths)
+        self.parser.save_weather()
+        if not history:
+            print("No usable activities in the update.")
+            return
+
+        new_history = self._concat_history(history)
+        spans = [(source_name(path), len(df)) for path, df in history]
+        del history
+        score = self.model.update(new_history, n_new_trees=n_new_trees)
+        print(f"Model Updated! Accuracy on new rides (R2): {score:.2f}")
+
+        self._store_partitions(spans, self.model.predict_drift(new_history))
+
+        # Fingerprint exactly the rides the model has seen (the stored partitions), so a later
+        # fit() reuses this model only while the folder holds those rides and nothing new.
+        by_name = {source_name(p): p for p in self._history_paths()}
+        by_name.update((source_name(p), p) for p in new_paths)
+        trained_ids = self.store.activity_ids()
+        training_key = self._training_key([by_name[i] for i in trained_ids if i in by_name])
+        unresolved = sorted(i for i in trained_ids if i not in by_name)
+        if unresolved:
+            training_key["unresolved"] = unresolved  # Rides from outside files that are gone; never matches a fit
+        self.model.save(self.model_path, fingerprint=self.model.fingerprint(training_key))
+        print(f"Model saved to: {self.model_path}")
 
     def mine_patterns(self):
         """
-        Mine global patterns from cached history and return a report for the dashboard.
+        Mine global patterns from the stored history and return a report for the dashboard.
         """
-        cache_path = os.path.join(self.history_folder, "history_cache.csv")
-        
-        if not os.path.exists(cache_path):
-            print("No history cache found. Please run .fit() first.")
+        if not self.store.exists():
+            print("No history store found. Please run .fit() first.")
             return
 
-        print(f"Loading history from {cache_path}...")
-        df_history = pd.read_csv(cache_path)
+        print(f"Loading history from {self.store.root}...")
+        df_history = self.store.read(columns=self.miner.required_columns)
         
         report = self.miner.discover_rules(df_history)  # Run NiaARM
 
@@ -104,6 +379,7 @@ class ContextTrainer:
         print(f"Analyzing {tcx_filepath}...")
 
         df = self._process_file(tcx_filepath, is_training=False)
+        self.parser.save_weather()
         df = self.counterfactual.analyze(df)
 
         return self.rationale.build_report(df)
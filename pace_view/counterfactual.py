@@ -2,6 +2,9 @@
 Counterfactual analysis for estimating environmental impact on performance.
 """
 
+import numpy as np
+import pandas as pd
+
 
 class CounterfactualAnalyzer:
     """
@@ -13,28 +16,70 @@ class CounterfactualAnalyzer:
         self.model = model
         self.standard_env = standard_env or {"temp": 20.0, "hum": 40.0, "ele": 100.0}
 
-    def analyze(self, df_new):
+    @staticmethod
+    def grid(feature, values):
         """
-        Add counterfactual fields (env_penalty_bpm, drift, hr_predicted) to a ride.
+        Build named scenarios that set one feature to each of the given values,
+        e.g. ``grid("temp", [10, 20, 30])``.
+        """
+        return {f"{feature}={value}": {feature: value} for value in values}
+
+    def predict_scenarios(self, df, scenarios):
+        """
+        Predict HR for the actual conditions and every scenario in one batched call.
+
+        ``scenarios`` is a list of ``{feature: value}`` overrides (scalars or per-row arrays).
+        Returns (actual_pred, scenario_preds) where scenario_preds has shape (n_scenarios, n_rows).
         """
         if not self.model.is_trained:
             raise Exception("Model not trained.")
 
-        df_new = df_new.copy()
+        features = self.model.features
+        X_actual = df[features].fillna(0).to_numpy(dtype=float)
+        n_rows = len(X_actual)
 
-        # 1. Predict HR under actual conditions
-        X_actual = df_new[self.model.features].fillna(0)
-        hr_actual_pred = self.model.model.predict(X_actual)
+        # One preallocated block per scenario, stacked under the actual rows.
+        stacked = np.empty(((len(scenarios) + 1) * n_rows, len(features)))
+        stacked[:n_rows] = X_actual
+        for i, scenario in enumerate(scenarios, start=1):
+            block = stacked[i * n_rows:(i + 1) * n_rows]
+            block[:] = X_actual
+            for key, value in scenario.items():
+                if key in features:
+                    block[:, features.index(key)] = value
 
-        # 2. Predict HR under standard conditions -> counterfactual
-        X_standard = X_actual.copy()
-        for key, value in self.standard_env.items():
-            if key in X_standard.columns:
-                X_standard[key] = value
+        preds = self.model.model.predict(pd.DataFrame(stacked, columns=features, copy=False))
+        preds = preds.reshape(len(scenarios) + 1, n_rows)
+        return preds[0], preds[1:]
 
-        hr_standard_pred = self.model.model.predict(X_standard)
+    def sweep(self, df, scenarios):
+        """
+        Per-row environmental penalty (actual minus scenario HR, bpm) for each scenario.
 
-        # 3. Calculate deltas
+        ``scenarios`` is a dict of ``{name: {feature: value}}`` (see `grid`) or a list of
+        override dicts. Returns a dataframe with one column per scenario; use ``.mean()``
+        for a per-scenario summary.
+        """
+        if not isinstance(scenarios, dict):
+            scenarios = {
+                ", ".join(f"{k}={v}" for k, v in scenario.items()): scenario for scenario in scenarios
+            }
+        actual_pred, scenario_preds = self.predict_scenarios(df, list(scenarios.values()))
+        return pd.DataFrame(
+            (actual_pred - scenario_preds).T,
+            columns=list(scenarios),
+            index=df.index,
+        )
+
+    def analyze(self, df_new):
+        """
+        Add counterfactual fields (env_penalty_bpm, drift, hr_predicted) to a ride.
+        """
+        # 1. Predict HR under actual and standard conditions in one pass
+        hr_actual_pred, (hr_standard_pred,) = self.predict_scenarios(df_new, [self.standard_env])
+
+        # 2. Calculate deltas
+        df_new = df_new.copy()
         df_new["hr_predicted"] = hr_actual_pred
         df_new["env_penalty_bpm"] = hr_actual_pred - hr_standard_pred
         df_new["drift"] = df_new["hr"] - df_new["hr_predicted"]
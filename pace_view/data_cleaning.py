@@ -3,9 +3,58 @@ Cleaning and alignment logic for parsed activity and weather data.
 """
 
 from dataclasses import dataclass
+import hashlib
+import os
 import numpy as np
 import pandas as pd
 import plotly.express as plotlyy
+from .data_parsing import TCXActivity, WeatherSeries, read_tcx_track
+from .tcx_sources import source_name
+from .training_load import TrainingLoadModel, summary_ride_keys
+
+LOAD_MODEL_FILENAME = "training_load.npz"
+
+
+def rolling_linear_trend(x, y, window, min_points=2):
+    """
+    Value of the least-squares line fitted over each trailing window [x_i - window, x_i].
+
+    ``x`` must be sorted ascending; points sharing x_i are all inside its window.
+    Window sums come from prefix sums, so any window length costs O(n).
+    Points whose window holds fewer than ``min_points`` samples get NaN.
+    """
+    x = np.asarray(x)
+    y = np.asarray(y, dtype=float)
+    n = len(x)
+    if n == 0:
+        return np.empty(0)
+
+    left = np.searchsorted(x, x - window, side="left")
+    right = np.searchsorted(x, x, side="right")
+    count = right - left
+
+    # The fitted values do not depend on the x scale, so shift and scale x to keep the squared sums well conditioned.
+    u = (x - x[0]).astype(float)
+    if window > 0:
+        u /= window
+
+    def window_sum(values):
+        prefix = np.concatenate(([0.0], np.cumsum(values)))
+        return prefix[right] - prefix[left]
+
+    sum_u, sum_y = window_sum(u), window_sum(y)
+    sum_uu, sum_uy = window_sum(u * u), window_sum(u * y)
+
+    spread = count * sum_uu - sum_u ** 2
+    covariance = count * sum_uy - sum_u * sum_y
+    # A window whose points share one x has no slope; the fit is then the mean (as with np.polyfit).
+    sloped = spread > 1e-12 * np.maximum(count * sum_uu, 1e-300)
+    slope = np.divide(covariance, spread, out=np.zeros(n), where=sloped)
+    intercept = (sum_y - slope * sum_u) / count
+
+    trend = slope * u + intercept
+    trend[count < min_points] = np.nan
+    return trend
 
 
 @dataclass
@@ -23,40 +72,103 @@ class DataCleaner:
     """
     def __init__(self, parser=None):
         self.parser = parser
+        self._trend_cache = {}
+        self._load_summary = None
+        self._load_model = None
+
+    @property
+    def load_model(self):
+        """
+        Fitness/fatigue/form `TrainingLoadModel` of the last dashboard summary, brought up
+        to date on first access (see `_update_load_model`; None before any summary).
+        """
+        if self._load_model is None and self._load_summary is not None:
+            self._load_model = self._update_load_model(self._load_summary)
+        return self._load_model
+
+    def _update_load_model(self, total_summary):
+        """
+        With the parser's `ActivityCache`, the load model persists next to it and only rides
+        it has not seen are added; it is rebuilt when rides have left the summary.
+        Without a cache it is built in memory.
+        """
+        cache = self.parser.cache if self.parser is not None else None
+        if cache is None:
+            return TrainingLoadModel.from_summary(total_summary)
+
+        path = os.path.join(cache.cache_dir, LOAD_MODEL_FILENAME)
+        keys = summary_ride_keys(total_summary)
+        model = None
+        if os.path.exists(path):
+            try:
+                model = TrainingLoadModel.load(path)
+            except (OSError, ValueError, KeyError):
+                model = None
+
+        if model is None or not model.rides <= set(keys):
+            model = TrainingLoadModel.from_summary(total_summary)
+            changed = True
+        else:
+            changed = False
+            for key, date, load in zip(keys, total_summary["date"], total_summary["trimp_bannister"]):
+                changed = model.add(date, load, ride=key) or changed
+
+        if changed:
+            os.makedirs(cache.cache_dir, exist_ok=True)
+            model.save(path)
+        return model
 
     def to_dataframe(self, act, weather_data):
         """
-        Clean and align parsed activity + weather into a dataframe.
+        Clean and align parsed activity + weather (a `WeatherSeries` or per-sample records) into a dataframe.
         """
-        if self.parser is None:
-            raise ValueError("DataCleaner requires a DataParser instance for weather-aligned dataframes.")
-        temps = [self.parser._get_val(w, ["temp", "temperature"]) for w in weather_data]
-        hums = [self.parser._get_val(w, ["hum", "humidity"]) for w in weather_data]
-        winds = [self.parser._get_val(w, ["wspd", "wind_speed"]) for w in weather_data]
-        bearings = [self.parser._get_val(w, ["wdir", "wind_direction"]) for w in weather_data]
+        if not isinstance(weather_data, WeatherSeries):
+            weather_data = WeatherSeries.from_records(weather_data)
 
         hr_numeric = pd.to_numeric(act["heartrates"], errors="coerce")
         speed_numeric = pd.to_numeric(act["speeds"], errors="coerce")
         min_len = min(len(act["timestamps"]), len(hr_numeric))
+        positions = np.asarray(act["positions"], dtype=float).reshape(-1, 2)
 
         df = pd.DataFrame(
             {
                 "time": act["timestamps"][:min_len],
-                "lat": [p[0] for p in act["positions"]][:min_len],
-                "lon": [p[1] for p in act["positions"]][:min_len],
+                "lat": positions[:min_len, 0],
+                "lon": positions[:min_len, 1],
                 "ele": act["altitudes"][:min_len],
                 "dist": act["distances"][:min_len],
                 "hr": hr_numeric[:min_len],
                 "speed_mps": speed_numeric[:min_len] / 3.6,
-                "temp": temps[:min_len],
-                "wind_speed_mps": np.array(winds[:min_len]) / 3.6,
-                "wind_dir": bearings[:min_len],
-                "hum": hums[:min_len],
+                "temp": weather_data["temp"][:min_len],
+                "wind_speed_mps": weather_data["wspd"][:min_len] / 3.6,
+                "wind_dir": weather_data["wdir"][:min_len],
+                "hum": weather_data["hum"][:min_len],
             }
         )
 
         return df
 
+    def compact_frame(self, df, drop_columns=()):
+        """
+        Shrink a per-second ride frame: float32 sensor columns, int64 epoch-second
+        timestamps, categoricals kept as-is, and ``drop_columns`` removed.
+        """
+        compact = {}
+        for col in df.columns:
+            if col in drop_columns:
+                continue
+            values = df[col]
+            if col == "time":
+                if not pd.api.types.is_integer_dtype(values):
+                    times = pd.to_datetime(values, utc=True).dt.tz_localize(None)
+                    values = times.to_numpy().astype("datetime64[s]").astype(np.int64)
+                compact[col] = values
+            elif isinstance(values.dtype, pd.CategoricalDtype):
+                compact[col] = values
+            else:
+                compact[col] = pd.to_numeric(values, errors="coerce").to_numpy(dtype=np.float32)
+        return pd.DataFrame(compact, index=df.index)
+
     def get_calory_average(self, exercises):
         """
         Calculate average calories across exercises.
@@ -68,7 +180,7 @@ class DataCleaner:
 
     def exercises_to_df(self, exercises):
         """
-        Convert tcxreader exercises into a summary dataframe.
+        Convert parsed exercises into a summary dataframe.
         """
         columns = [
             "activity_type",
@@ -98,31 +210,57 @@ class DataCleaner:
 
     def exercise_timeframes(self, exercise):
         """
-        Convert a tcxreader exercise into a clean time-series dataframe.
-        """
-        rows = []
-        if exercise.trackpoints:
-            for tp in exercise.trackpoints:
-                rows.append(
-                    {
-                        "time": pd.to_datetime(tp.time, utc=True, errors="coerce"),
-                        "h_r": tp.hr_value,
-                        "dist_m": tp.distance,
-                        "alt_m": tp.elevation,
-                        "lat": tp.latitude,
-                        "lon": tp.longitude,
-                    }
-                )
-
-            df = pd.DataFrame(rows).dropna(subset=["time"]).sort_values("time").drop_duplicates("time")
-            for c in ["h_r", "dist_m", "alt_m", "lat", "lon"]:
-                if c in df.columns:
-                    df[c] = pd.to_numeric(df[c], errors="coerce")
-
-            df["dt_s"] = df["time"].diff().dt.total_seconds().clip(lower=0)
-            df["speed_mps"] = df["dist_m"].diff() / df["dt_s"].replace(0, np.nan)
-            return df.reset_index(drop=True)
-        return None
+        Convert a parsed exercise (`TCXActivity` or tcxreader exercise) into a clean time-series dataframe.
+        """
+        if isinstance(exercise, TCXActivity):
+            if len(exercise) == 0:
+                return None
+            df = pd.DataFrame(
+                {
+                    "time": pd.to_datetime(exercise.timestamps, utc=True),
+                    "h_r": exercise.heartrates,
+                    "dist_m": exercise.distances,
+                    "alt_m": exercise.altitudes,
+                    "lat": exercise.latitudes,
+                    "lon": exercise.longitudes,
+                }
+            )
+            return self._finalize_timeframes(df)
+
+        if not exercise.trackpoints:
+            return None
+
+        # Gather each attribute column-wise in one pass and convert timestamps in bulk.
+        times, h_r, dist_m, alt_m, lat, lon = zip(
+            *[
+                (tp.time, tp.hr_value, tp.distance, tp.elevation, tp.latitude, tp.longitude)
+                for tp in exercise.trackpoints
+            ]
+        )
+        df = pd.DataFrame(
+            {
+                "time": pd.to_datetime(list(times), utc=True, errors="coerce"),
+                "h_r": list(h_r),
+                "dist_m": list(dist_m),
+                "alt_m": list(alt_m),
+                "lat": list(lat),
+                "lon": list(lon),
+            }
+        )
+        return self._finalize_timeframes(df)
+
+    def _finalize_timeframes(self, df):
+        """
+        Sort, de-duplicate, and derive per-sample time deltas and speed.
+        """
+        df = df.dropna(subset=["time"]).sort_values("time").drop_duplicates("time")
+        for c in ["h_r", "dist_m", "alt_m", "lat", "lon"]:
+            if c in df.columns:
+                df[c] = pd.to_numeric(df[c], errors="coerce")
+
+        df["dt_s"] = df["time"].diff().dt.total_seconds().clip(lower=0)
+        df["speed_mps"] = df["dist_m"].diff() / df["dt_s"].replace(0, np.nan)
+        return df.reset_index(drop=True)
 
     def hrr_intensity(self, h_r: pd.Series, config: AthleteConfig) -> pd.Series:
         return (h_r - config.h_r_rest) / (config.h_r_max - config.h_r_rest)
@@ -188,7 +326,133 @@ class DataCleaner:
                         summaries.append(dict_exer)
         return pd.DataFrame(summaries).sort_values("start_time")
 
-    def hr_zones_summary(self, total_summary: pd.DataFrame, period: str) -> pd.DataFrame:
+    def summarize_track(self, timestamps, h_r, dist_m, config=None, source_file=None) -> dict:
+        """
+        Summary of a ride (as `summarize_exercise` on its timeframes) computed in bulk from
+        its time, heart rate, and distance arrays. Returns None when no time is valid.
+        """
+        cfg = config or AthleteConfig()
+        times = np.asarray(timestamps)
+        if times.dtype.kind != "M":
+            times = times.astype("datetime64[ns]")
+        valid = ~np.isnat(times)
+        times, h_r, dist_m = times[valid], np.asarray(h_r, dtype=float)[valid], np.asarray(dist_m, dtype=float)[valid]
+        if len(times) == 0:
+            return None
+
+        # Sorted by time with repeated times dropped, like `_finalize_timeframes`
+        order = np.argsort(times, kind="stable")
+        times, h_r, dist_m = times[order], h_r[order], dist_m[order]
+        first = np.ones(len(times), dtype=bool)
+        first[1:] = times[1:] != times[:-1]
+        times, h_r, dist_m = times[first], h_r[first], dist_m[first]
+
+        dt_s = np.full(len(times), np.nan)
+        dt_s[1:] = np.diff(times) / np.timedelta64(1, "s")
+        speed = np.full(len(times), np.nan)
+        speed[1:] = np.diff(dist_m) / dt_s[1:]
+
+        hrr = np.clip((h_r - cfg.h_r_rest) / (cfg.h_r_max - cfg.h_r_rest), 0, 1.2)
+        zones = np.digitize(hrr, np.array(cfg.h_r_r_bound), right=True).clip(1, 5)
+        counted = ~np.isnan(dt_s)
+        zone_s = np.bincount(zones[counted] - 1, weights=dt_s[counted], minlength=5)
+        trimp_edwards = 0.0
+        for k, coeff in enumerate(cfg.coefficient):
+            trimp_edwards += coeff * zone_s[k] / 60.0
+
+        start = pd.Timestamp(times[0]).tz_localize("UTC")
+        has_dist = ~np.isnan(dist_m)
+        has_hr = ~np.isnan(h_r)
+        has_speed = ~np.isnan(speed)
+        return {
+            "date": start.tz_convert(None).date(),
+            "start_time": start,
+            "source_file": source_file,
+            "duration_s": float(dt_s[counted].sum()),
+            "distance_km": float(dist_m[-1] - dist_m[0]) / 1000.0 if has_dist.any() else np.nan,
+            "avg_h_r": float(h_r[has_hr].mean()) if has_hr.any() else np.nan,
+            "avg_speed_mps": float(speed[has_speed].mean()) if has_speed.any() else np.nan,
+            "trimp_bannister": float(np.nansum(np.nan_to_num(dt_s / 60.0) * hrr * np.exp(cfg.b * hrr))),
+            "trimp_edwards": float(trimp_edwards),
+            **{f"z{k}_sec": float(zone_s[k - 1]) for k in range(1, 6)},
+        }
+
+    def summarize_file(self, filepath, config=None, source_file=None) -> dict:
+        """
+        Summary of a TCX ride (as `summarize_exercise`) without the full parse.
+
+        Only trackpoint times, HR, and distances are read (see `data_parsing.read_tcx_track`)
+        and summarized in bulk by `summarize_track`, so no `TCXActivity` or dataframe is
+        built. Returns None for non-biking or empty rides. Summaries are cached in the
+        parser's `ActivityCache` when set.
+        """
+        cfg = config or AthleteConfig()
+        source_file = source_file if source_file is not None else source_name(filepath)
+        cache = self.parser.cache if self.parser is not None else None
+        kind = "summary-" + hashlib.sha1(
+            repr((cfg.h_r_max, cfg.h_r_rest, cfg.h_r_r_bound, cfg.coefficient, cfg.b)).encode("utf-8")
+        ).hexdigest()[:12]
+
+        if cache is not None:
+            cached = cache.load_arrays(filepath, kind)
+            if cached is not None:
+                return self._summary_from_arrays(cached, source_file)
+
+        # Like read_tcx, a ride takes the sport of its last Activity; a missing Sport is not biking
+        activity_type, timestamps, h_r, dist_m = read_tcx_track(filepath)
+        summary = None
+        if activity_type == "Biking":
+            summary = self.summarize_track(timestamps, h_r, dist_m, cfg, source_file=source_file)
+
+        if cache is not None:
+            cache.store_arrays(filepath, kind, self._summary_to_arrays(summary))
+        return summary
+
+    @staticmethod
+    def _summary_to_arrays(summary):
+        if summary is None:
+            return {"empty": np.array(True)}
+        arrays = {
+            k: np.asarray(v, dtype=float) for k, v in summary.items() if k not in ("date", "start_time", "source_file")
+        }
+        arrays["start_time"] = np.datetime64(summary["start_time"].tz_convert(None).to_datetime64(), "us")
+        return arrays
+
+    @staticmethod
+    def _summary_from_arrays(arrays, source_file):
+        if "empty" in arrays:
+            return None
+        start = pd.Timestamp(arrays.pop("start_time")[()]).tz_localize("UTC")
+        return {
+            "date": start.tz_convert(None).date(),
+            "start_time": start,
+            "source_file": source_file,
+            **{k: float(v) for k, v in arrays.items()},
+        }
+
+    def file_summaries(self, filepaths, config=None) -> pd.DataFrame:
+        """
+        Per-ride summaries of TCX files via `summarize_file`; unreadable files are skipped.
+        """
+        summaries = []
+        for filepath in filepaths:
+            try:
+                summary = self.summarize_file(filepath, config=config)
+            except Exception as e:
+                print(f"Error reading {filepath}: {e}")
+                continue
+            if summary:
+                summaries.append(summary)
+        return pd.DataFrame(summaries).sort_values("start_time")
+
+    def hr_zones_summary(self, total_summary: pd.DataFrame, period: str, zone_index=None) -> pd.DataFrame:
+        """
+        Zone seconds over the trailing ``period`` up to the latest session.
+        Pass a `ZoneIndex` built from the same summary to answer without scanning the frame.
+        """
+        if zone_index is not None:
+            return zone_index.zone_mix(period)
+
         df = total_summary.copy()
         df["date"] = pd.to_datetime(df["date"])
         max_date = df["date"].max()
@@ -213,8 +477,18 @@ class DataCleaner:
         """
         Build the dashboard summary dataframe from tcxreader exercises.
         """
-        total_summary = self.exercise_summaries(exercises)
+        return self._dashboard_frame(self.exercise_summaries(exercises))
 
+    def build_dashboard_from_files(self, filepaths):
+        """
+        Build the dashboard summary dataframe straight from TCX files (see `summarize_file`).
+        """
+        return self._dashboard_frame(self.file_summaries(filepaths))
+
+    def _dashboard_frame(self, total_summary):
+        """
+        Add the calendar and unit columns used by the dashboard; `load_model` is rebuilt from it on next access.
+        """
         if total_summary.empty:
             raise ValueError("No usable trackpoints found in given TCX files.")
 
@@ -227,26 +501,45 @@ class DataCleaner:
         total_summary["month"] = total_summary["date"].dt.to_period("M").astype(str)
         total_summary["week"] = total_summary["date"].dt.to_period("W").astype(str)
 
-        daily_load = total_summary.groupby("date")["trimp_bannister"].sum()
-        daily_load.index = pd.to_datetime(daily_load.index)
-        daily_load = daily_load.asfreq("D", fill_value=0)
-
-        _ = self.ewma_series(daily_load, 42)
-        _ = self.ewma_series(daily_load, 7)
+        self._load_summary = total_summary
+        self._load_model = None
 
         return total_summary
 
-    def return_figures(self, total_summary: pd.DataFrame, period, window_days=90):
+    def efficiency_trend(self, dates, values, window_days, min_points=2):
         """
-        Build plotly figures for the dashboard.
+        Rolling linear trend of ``values`` over the trailing ``window_days`` (see `rolling_linear_trend`).
+        Results are cached per window length until the dates or values change.
         """
-        weekly_z_hours = self.hr_zones_summary(total_summary, period)
-        figuero1 = plotlyy.pie(
+        # Integer nanoseconds keep the window bounds exact.
+        x_ns = np.asarray(pd.to_datetime(dates), dtype="datetime64[ns]").astype(np.int64)
+        y = np.asarray(values, dtype=float)
+        digest = hashlib.sha1(x_ns.tobytes() + y.tobytes()).hexdigest()
+        if self._trend_cache.get("digest") != digest:
+            self._trend_cache = {"digest": digest}
+
+        key = (window_days, min_points)
+        if key not in self._trend_cache:
+            self._trend_cache[key] = rolling_linear_trend(
+                x_ns, y, window_days * 86400 * 10**9, min_points=min_points
+            )
+        return self._trend_cache[key]
+
+    def zone_mix_figure(self, total_summary: pd.DataFrame, period, zone_index=None):
+        """
+        Pie chart of time in HR zones over the trailing ``period``.
+        """
+        weekly_z_hours = self.hr_zones_summary(total_summary, period, zone_index=zone_index)
+        return plotlyy.pie(
             weekly_z_hours,
             names="category",
             values="value",
         )
 
+    def efficiency_figure(self, total_summary: pd.DataFrame, window_days=90):
+        """
+        Speed-per-heart-rate scatter with its rolling ``window_days`` trend line.
+        """
         fig2_df = total_summary.copy()
         fig2_df = fig2_df.dropna(subset=["avg_h_r"])
         fig2_df = fig2_df[fig2_df["speed_kmh"] > 0]
@@ -254,21 +547,7 @@ class DataCleaner:
         fig2_df = fig2_df.sort_values("date")
         fig2_df["date"] = pd.to_datetime(fig2_df["date"])
 
-        min_points = 2
-        x_seconds = fig2_df["date"].astype("int64") / 1e9
-
-        rolling = []
-
-        for i, current_date in enumerate(fig2_df["date"]):
-            start_date = current_date - pd.Timedelta(days=window_days)
-            truth_condition = (fig2_df["date"] >= start_date) & (fig2_df["date"] <= current_date)
-            xs = x_seconds[truth_condition]
-            ys = fig2_df.loc[truth_condition, "speed_kmh_per_avg_h_r"]
-            if len(xs) >= min_points:
-                slope, intercept = np.polyfit(xs, ys, 1)
-                rolling.append(slope * x_seconds.iloc[i] + intercept)
-            else:
-                rolling.append(np.nan)
+        rolling = self.efficiency_trend(fig2_df["date"], fig2_df["speed_kmh_per_avg_h_r"], window_days)
 
         fig2_kwargs = {}
         line_custom_data = None
@@ -290,8 +569,13 @@ class DataCleaner:
             name=f"{window_days}D rolling trend",
             customdata=line_custom_data,
         )
+        return figuero2
 
-        figuero3 = plotlyy.scatter(
+    def hr_speed_figure(self, total_summary: pd.DataFrame):
+        """
+        Average HR vs. speed scatter with per-month OLS trendlines.
+        """
+        return plotlyy.scatter(
             total_summary,
             x="avg_h_r",
             y="speed_kmh",
@@ -299,13 +583,22 @@ class DataCleaner:
             trendline="ols",
         )
 
+    def hr_heatmap_figure(self, total_summary: pd.DataFrame):
+        """
+        Heatmap of mean HR by speed and duration bins.
+        """
         speed_bins = np.arange(0, total_summary["speed_kmh"].max() + 3, 3)
         dur_bins = np.arange(0, total_summary["duration_min"].max() + 15, 15)
-        total_summary["speed_bin"] = pd.cut(total_summary["speed_kmh"], bins=speed_bins)
-        total_summary["dur_bin"] = pd.cut(total_summary["duration_min"], bins=dur_bins)
+        binned = pd.DataFrame(
+            {
+                "dur_bin": pd.cut(total_summary["duration_min"], bins=dur_bins),
+                "speed_bin": pd.cut(total_summary["speed_kmh"], bins=speed_bins),
+                "avg_h_r": total_summary["avg_h_r"],
+            }
+        )
 
         hm = (
-            total_summary.groupby(["dur_bin", "speed_bin"], observed=True)["avg_h_r"]
+            binned.groupby(["dur_bin", "speed_bin"], observed=True)["avg_h_r"]
             .mean()
             .reset_index()
         )
@@ -313,7 +606,7 @@ class DataCleaner:
         hm["speed_mid"] = hm["speed_bin"].apply(lambda x: x.mid)
         hm["dur_mid"] = hm["dur_bin"].apply(lambda x: x.mid)
 
-        figuero4 = plotlyy.density_heatmap(
+        return plotlyy.density_heatmap(
             hm,
             x="speed_mid",
             y="dur_mid",
@@ -325,4 +618,14 @@ class DataCleaner:
             title="Heatmap: mean HR by speed x duration",
         )
 
-        return figuero1, figuero2, figuero3, figuero4
+    def return_figures(self, total_summary: pd.DataFrame, period, window_days=90):
+        """
+        Build plotly figures for the dashboard.
+        Use the per-figure builders when only one figure is needed.
+        """
+        return (
+            self.zone_mix_figure(total_summary, period),
+            self.efficiency_figure(total_summary, window_days),
+            self.hr_speed_figure(total_summary),
+            self.hr_heatmap_figure(total_summary),
+        )
@@ -3,77 +3,459 @@ Parsing utilities for TCX files and optional weather enrichment.
 """
 
 import os
-from tcxreader.tcxreader import TCXReader
-from sport_activities_features.tcx_manipulation import TCXFile
-from sport_activities_features import WeatherIdentification
+import warnings
+import xml.etree.ElementTree as ET
+from dataclasses import dataclass, field
+import numpy as np
+import pandas as pd
+from .tcx_sources import list_tcx_sources, open_tcx
+from .weather import (
+    WEATHER_CACHE_FILENAME,
+    CachedWeatherProvider,
+    VisualCrossingProvider,
+    WeatherCache,
+    hourly_points,
+    prefetch,
+)
+
+TCX_NS = "{http://www.garmin.com/xmlschemas/TrainingCenterDatabase/v2}"
+
+
+def _to_float(text):
+    """
+    Convert XML text to float, mapping missing or malformed values to NaN.
+    """
+    try:
+        return float(text)
+    except (TypeError, ValueError):
+        return np.nan
+
+
+@dataclass
+class TCXActivity:
+    """
+    Columnar view of a TCX file: per-trackpoint arrays plus lap-level summary fields.
+
+    Summary fields follow tcxreader semantics so the object can be used wherever a
+    tcxreader exercise was used for dashboard summaries.
+    """
+    activity_type: str = None
+    calories: int = 0
+    distance: float = 0.0
+    start_time: pd.Timestamp = None
+    end_time: pd.Timestamp = None
+    duration: float = 0
+    avg_speed: float = 0.0
+    altitude_avg: float = None
+    timestamps: np.ndarray = field(default_factory=lambda: np.array([], dtype="datetime64[us]"))
+    latitudes: np.ndarray = field(default_factory=lambda: np.array([], dtype=float))
+    longitudes: np.ndarray = field(default_factory=lambda: np.array([], dtype=float))
+    altitudes: np.ndarray = field(default_factory=lambda: np.array([], dtype=float))
+    distances: np.ndarray = field(default_factory=lambda: np.array([], dtype=float))
+    heartrates: np.ndarray = field(default_factory=lambda: np.array([], dtype=float))
+    speeds: np.ndarray = field(default_factory=lambda: np.array([], dtype=float))
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    def to_activity(self):
+        """
+        Build the activity dict used by the model pipeline.
+
+        Mirrors sport_activities_features `TCXFile.extract_activity_data`: points that
+        repeat the previous timestamp are dropped and speed (km/h) is derived from
+        consecutive distance/time deltas.
+        """
+        valid = ~np.isnat(self.timestamps)
+        timestamps = self.timestamps[valid]
+        keep = np.ones(len(timestamps), dtype=bool)
+        keep[1:] = np.diff(timestamps) != np.timedelta64(0)
+
+        timestamps = timestamps[keep]
+        distances = self.distances[valid][keep].copy()
+        if len(distances) and np.isnan(distances[0]):
+            distances[0] = 0.0
+
+        speeds = np.zeros(len(timestamps))
+        if len(timestamps) > 1:
+            delta_t = np.diff(timestamps) / np.timedelta64(1, "s")
+            speeds[1:] = np.diff(distances) / delta_t * 3.6
+
+        return {
+            "activity_type": self.activity_type,
+            "positions": np.column_stack((self.latitudes[valid][keep], self.longitudes[valid][keep])),
+            "altitudes": self.altitudes[valid][keep],
+            "distances": distances,
+            "total_distance": self.distance,
+            "timestamps": timestamps,
+            "heartrates": self.heartrates[valid][keep],
+            "speeds": speeds,
+            "start_time": self.start_time,
+        }
+
+
+class WeatherSeries:
+    """
+    Per-sample weather as columns: temp (C), wspd (km/h), wdir (deg), and hum (%).
+
+    Each column is a NumPy array or a scalar that is broadcast only when read, so
+    constant (neutral) weather costs nothing per sample. ``series["temp"]`` returns
+    a column and ``series[i]`` a dict for one sample.
+    """
+    fields = ("temp", "wspd", "wdir", "hum")
+    # Accepted names per column for dict records and weather objects
+    aliases = {
+        "temp": ("temp", "temperature"),
+        "wspd": ("wspd", "wind_speed"),
+        "wdir": ("wdir", "wind_direction"),
+        "hum": ("hum", "humidity", "relative_humidity"),
+    }
+    # Neutral weather, used when no weather is known
+    neutral = {"temp": 20, "wspd": 0, "wdir": 0, "hum": 20}
+
+    def __init__(self, length, temp, wspd, wdir, hum):
+        self.length = int(length)
+        self.columns = {"temp": temp, "wspd": wspd, "wdir": wdir, "hum": hum}
+
+    @classmethod
+    def constant(cls, length, **values):
+        """
+        The same weather for every sample (neutral by default, see `neutral`).
+        """
+        return cls(length, **{**cls.neutral, **values})
+
+    @classmethod
+    def from_records(cls, records):
+        """
+        Build columns from per-sample dicts or weather objects (e.g. `AverageWeather`).
+        Missing values read as 0.0.
+        """
+        columns = {name: [] for name in cls.fields}
+        for item in records:
+            for name in cls.fields:
+                value = 0.0
+                for key in cls.aliases[name]:
+                    if isinstance(item, dict):
+                        if key in item:
+                            value = item[key]
+                            break
+                    elif hasattr(item, key):
+                        value = getattr(item, key)
+                        break
+                columns[name].append(value)
+        length = len(columns["temp"])
+        return cls(length, **{name: np.asarray(values) for name, values in columns.items()})
+
+    def column(self, name):
+        """
+        Return one column as an array of ``len(self)`` values.
+        """
+        values = self.columns[name]
+        if self.length == 0:
+            return np.empty(0)
+        if np.ndim(values) == 0:
+            return np.full(self.length, values)
+        return np.asarray(values)
+
+    def __len__(self):
+        return self.length
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            return self.column(key)
+        row = {}
+        for name, values in self.columns.items():
+            value = values if np.ndim(values) == 0 else values[key]
+            row[name] = value.item() if isinstance(value, np.generic) else value
+        return row
+
+    def __iter__(self):
+        return (self[i] for i in range(self.length))
+
+
+def _blend_samples(sample_ns, values, t):
+    """
+    Linear interpolation of ``values`` at sample times ``sample_ns`` (sorted) onto ``t``,
+    clamped to the nearest sample outside the sampled span.
+    """
+    last = len(sample_ns) - 1
+    right = np.searchsorted(sample_ns, t, side="right")
+    left = np.clip(right - 1, 0, last)
+    right = np.clip(right, 0, last)
+    span = sample_ns[right] - sample_ns[left]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        weight = np.where(span > 0, (t - sample_ns[left]) / span, 0.0)
+    return values[..., left] * (1 - weight) + values[..., right] * weight
+
+
+def interpolate_weather(sample_times, samples, timestamps):
+    """
+    Map weather samples onto every timestamp and return a `WeatherSeries`.
+
+    Each timestamp is placed between its two neighbouring samples with one
+    ``searchsorted`` and blended linearly by time; wind direction is blended as a
+    unit vector so that e.g. 350 and 10 degrees average to 0, not 180. Timestamps
+    outside the sampled span take the nearest sample. ``samples`` maps each
+    `WeatherSeries` field to one value per sample time. Missing (None/NaN) values
+    are bridged from the neighbouring samples of the same field; a field with no
+    value at all takes its `WeatherSeries.neutral` value.
+    """
+    timestamps = np.asarray(timestamps, dtype="datetime64[ns]")
+    sample_times = np.asarray(sample_times, dtype="datetime64[ns]")
+    if len(sample_times) == 0:
+        raise ValueError("No weather samples to interpolate.")
+
+    order = np.argsort(sample_times, kind="stable")
+    sample_ns = sample_times[order].astype(np.int64).astype(float)
+    t = timestamps.astype(np.int64).astype(float)
+
+    columns = {}
+    for name in WeatherSeries.fields:
+        values = np.array([np.nan if v is None else v for v in samples[name]], dtype=float)[order]
+        known = ~np.isnan(values)
+        if not known.any():
+            columns[name] = WeatherSeries.neutral[name]
+        elif name == "wdir":
+            radians = np.deg2rad(values[known])
+            sin, cos = _blend_samples(sample_ns[known], np.stack([np.sin(radians), np.cos(radians)]), t)
+            columns[name] = np.rad2deg(np.arctan2(sin, cos)) % 360
+        else:
+            columns[name] = _blend_samples(sample_ns[known], values[known], t)
+    return WeatherSeries(len(timestamps), **columns)
+
+
+def read_tcx(source):
+    """
+    Stream a TCX file once with iterparse and return a `TCXActivity`.
+    ``source`` may be compressed or an archive member (see `tcx_sources.open_tcx`).
+
+    Trackpoints without longitude are dropped (as tcxreader does) and each element is
+    cleared after it is read, so memory stays proportional to the output arrays.
+    """
+    activity = TCXActivity()
+    times, lats, lons, alts, dists, hrs, speeds = [], [], [], [], [], [], []
+
+    with open_tcx(source) as handle:
+        for _, elem in ET.iterparse(handle, events=("end",)):
+            tag = elem.tag
+            if tag == TCX_NS + "Trackpoint":
+                lon = _to_float(elem.findtext(f"{TCX_NS}Position/{TCX_NS}LongitudeDegrees"))
+                if not np.isnan(lon):
+                    times.append(elem.findtext(TCX_NS + "Time"))
+                    lats.append(_to_float(elem.findtext(f"{TCX_NS}Position/{TCX_NS}LatitudeDegrees")))
+                    lons.append(lon)
+                    alts.append(_to_float(elem.findtext(TCX_NS + "AltitudeMeters")))
+                    dists.append(_to_float(elem.findtext(TCX_NS + "DistanceMeters")))
+                    hrs.append(_to_float(elem.findtext(f"{TCX_NS}HeartRateBpm/{TCX_NS}Value")))
+                    speed = np.nan
+                    for ext in elem.iter():
+                        if ext.tag.endswith("}Speed"):
+                            speed = _to_float(ext.text)
+                            break
+                    speeds.append(speed)
+                elem.clear()
+            elif tag == TCX_NS + "Lap":
+                calories = elem.findtext(TCX_NS + "Calories")
+                if calories is not None:
+                    activity.calories += int(round(float(calories)))
+                activity.distance += np.nan_to_num(_to_float(elem.findtext(TCX_NS + "DistanceMeters")))
+                elem.clear()
+            elif tag == TCX_NS + "Activity":
+                activity.activity_type = elem.attrib.get("Sport")
+                elem.clear()
+
+    timestamps = pd.to_datetime(pd.Series(times, dtype=object), utc=True, format="ISO8601", errors="coerce")
+    # Naive UTC, like tcxreader's datetimes for the common "...Z" timestamps.
+    timestamps = timestamps.dt.tz_convert(None)
+    activity.timestamps = timestamps.to_numpy()
+    activity.latitudes = np.asarray(lats, dtype=float)
+    activity.longitudes = np.asarray(lons, dtype=float)
+    activity.altitudes = np.asarray(alts, dtype=float)
+    activity.distances = np.asarray(dists, dtype=float)
+    activity.heartrates = np.asarray(hrs, dtype=float)
+    activity.speeds = np.asarray(speeds, dtype=float)
+
+    if np.isfinite(activity.altitudes).any():
+        activity.altitude_avg = float(np.nanmean(activity.altitudes))
+
+    if len(timestamps) > 2:
+        activity.start_time = timestamps.iloc[0]
+        activity.end_time = timestamps.iloc[-1]
+        activity.duration = abs((activity.end_time - activity.start_time).total_seconds())
+        activity.avg_speed = (activity.distance / activity.duration) * 3.6 if activity.duration != 0 else 0.0
+
+    return activity
+
+
+def _text_to_floats(texts):
+    return pd.to_numeric(pd.Series(texts, dtype=object), errors="coerce").to_numpy(dtype=float)
+
+
+def read_tcx_track(source):
+    """
+    Light-weight pass for the activity list: like `read_tcx` it iterparses ``source``
+    and clears each element, but keeps only each trackpoint's time, heart rate, and
+    distance, converted to arrays in bulk at the end. Trackpoints without longitude are
+    dropped as in `read_tcx`. Returns (activity_type, timestamps, heartrates, distances),
+    where activity_type is the Sport of the last Activity (None when missing).
+    """
+    time_tag, position_tag = TCX_NS + "Time", TCX_NS + "Position"
+    hr_tag, dist_tag = TCX_NS + "HeartRateBpm", TCX_NS + "DistanceMeters"
+    lon_tag, value_tag = TCX_NS + "LongitudeDegrees", TCX_NS + "Value"
+    activity_type = None
+    times, lons, hrs, dists = [], [], [], []
+
+    with open_tcx(source) as handle:
+        for _, elem in ET.iterparse(handle, events=("end",)):
+            tag = elem.tag
+            if tag == TCX_NS + "Trackpoint":
+                time = lon = h_r = dist = None
+                for child in elem:
+                    child_tag = child.tag
+                    if child_tag == time_tag:
+                        time = child.text
+                    elif child_tag == position_tag:
+                        lon = child.findtext(lon_tag)
+                    elif child_tag == dist_tag:
+                        dist = child.text
+                    elif child_tag == hr_tag:
+                        h_r = child.findtext(value_tag)
+                times.append(time)
+                lons.append(lon)
+                hrs.append(h_r)
+                dists.append(dist)
+                elem.clear()
+            elif tag == TCX_NS + "Activity":
+                activity_type = elem.attrib.get("Sport")
+                elem.clear()
+
+    keep = ~np.isnan(_text_to_floats(lons))
+    timestamps = pd.to_datetime(pd.Series(times, dtype=object), utc=True, format="ISO8601", errors="coerce")
+    timestamps = timestamps.dt.tz_convert(None).to_numpy()[keep]
+    return activity_type, timestamps, _text_to_floats(hrs)[keep], _text_to_floats(dists)[keep]
 
 
 class DataParser:
     """
     Loads raw TCX data and fetches weather context (if configured).
+
+    An optional `ActivityCache` lets repeated reads skip XML parsing. Weather comes
+    from ``weather_provider`` (e.g. `weather.LocalWeatherProvider`) or, given an API
+    key, from VisualCrossing; either way hourly samples go through a
+    `weather.CachedWeatherProvider`, persisted next to the activity cache when one is set.
+    ``time_delta`` is deprecated and ignored: weather samples are hourly.
     """
-    def __init__(self, weather_api_key=None, time_delta=1):
+    def __init__(self, weather_api_key=None, time_delta=None, cache=None, weather_provider=None):
+        if time_delta is not None:
+            warnings.warn(
+                "time_delta is deprecated and ignored; weather is sampled hourly.", DeprecationWarning, stacklevel=2
+            )
         self.api_key = weather_api_key
-        self.time_delta = time_delta
-        self.tcx_loader = TCXFile()
-        self.tcx_reader = TCXReader()
+        self.cache = cache
+
+        if weather_provider is None and weather_api_key:
+            weather_provider = VisualCrossingProvider(weather_api_key)
+        if weather_provider is not None and not isinstance(weather_provider, CachedWeatherProvider):
+            path = os.path.join(cache.cache_dir, WEATHER_CACHE_FILENAME) if cache is not None else None
+            weather_provider = CachedWeatherProvider(weather_provider, WeatherCache(path))
+        self.weather = weather_provider
 
-    def _get_val(self, item, keys):
+    def read_activity(self, filepath):
         """
-        Safely read a value from dict-like or object-like items.
+        Read a TCX file once into a columnar `TCXActivity`, using the cache if set.
         """
-        for k in keys:
-            if isinstance(item, dict):
-                if k in item:
-                    return item[k]
-            else:
-                if hasattr(item, k):
-                    return getattr(item, k)
-        return 0.0
+        if self.cache is None:
+            return read_tcx(filepath)
+
+        activity = self.cache.load_activity(filepath)
+        if activity is None:
+            activity = read_tcx(filepath)
+            self.cache.store_activity(filepath, activity)
+        return activity
+
+    def uses_weather(self, is_training=False):
+        """
+        Whether parse_file will look up weather (otherwise weather is neutral).
+        """
+        return self.weather is not None and not is_training
+
+    def hourly_weather(self, positions, timestamps):
+        """
+        Weather for every hour a ride spans, each looked up near the rider's position at that hour.
+        Returns (hours, {field: values}).
+        """
+        hours, lats, lons = hourly_points(positions, timestamps)
+        samples = [self.weather.fetch(lat, lon, pd.Timestamp(hour)) for hour, lat, lon in zip(hours, lats, lons)]
+        columns = {
+            name: np.array([np.nan if s.get(name) is None else s[name] for s in samples], dtype=float)
+            for name in WeatherSeries.fields
+        }
+        return hours, columns
+
+    def save_weather(self):
+        """
+        Persist weather samples fetched since the last save. parse_file only fills the
+        in-memory cache, so call this once after a batch of rides.
+        """
+        if self.weather is not None:
+            self.weather.save()
+
+    def prefetch_weather(self, filepaths, **kwargs):
+        """
+        Fetch the weather of many rides up front (see `weather.prefetch` for the options).
+        Unreadable files are skipped; returns the prefetch counts.
+        """
+        if self.weather is None:
+            raise ValueError("No weather provider or API key configured.")
+
+        def rides():
+            for filepath in filepaths:
+                try:
+                    act = self.read_activity(filepath).to_activity()
+                except Exception as e:
+                    print(f"Error reading {filepath}: {e}")
+                    continue
+                yield act["positions"], act["timestamps"]
+
+        return prefetch(self.weather, rides(), **kwargs)
 
     def parse_file(self, filepath, is_training=False):
         """
         Parse a TCX file and fetch weather data (if enabled).
-        Returns (activity_dict, weather_data_list) or None if invalid.
+        Returns (activity_dict, `WeatherSeries`) or None if invalid.
         """
         try:
-            raw = self.tcx_loader.read_one_file(filepath)
-            act = self.tcx_loader.extract_activity_data(raw, numpy_array=True)
-            if "Biking" not in act.get("activity_type", ""):
+            act = self.read_activity(filepath).to_activity()
+            if "Biking" not in (act.get("activity_type") or ""):
                 return None
         except Exception as e:
             print(f"Error reading {filepath}: {e}")
             return None
 
-        weather_data = []
-        if self.api_key and not is_training:
+        weather_data = WeatherSeries.constant(len(act["timestamps"]))  # Neutral weather
+        if self.uses_weather(is_training):
             try:
-                wid = WeatherIdentification(act["positions"], act["timestamps"], self.api_key)
-                w_list = wid.get_weather(time_delta=self.time_delta)
-                weather_data = wid.get_average_weather_data(act["timestamps"], w_list)
+                hours, samples = self.hourly_weather(act["positions"], act["timestamps"])
+                weather_data = interpolate_weather(hours, samples, act["timestamps"])
             except Exception as e:
                 print(f"Weather API Error: {e}. Using Neutral weather.")
-                weather_data = [{"temp": 20, "wspd": 0, "wdir": 0, "hum": 20}] * len(act["timestamps"])
-        else:
-            weather_data = [{"temp": 20, "wspd": 0, "wdir": 0, "hum": 20}] * len(act["timestamps"])
 
         return act, weather_data
 
     def parse_tcx_file(self, filepath):
         """
-        Parse a TCX file using tcxreader (for dashboard summaries).
+        Parse a TCX file into a `TCXActivity` (for dashboard summaries).
         """
-        return self.tcx_reader.read(filepath, null_value_handling=1)
+        return self.read_activity(filepath)
 
     def parse_tcx_directory(self, dir_path, read_limit=600):
         """
-        Parse a folder of TCX files into a list of (start_time, exercise).
+        Parse a folder of TCX files (plain, compressed, or in zip archives) into a list of (start_time, exercise).
         """
         exercise_val = []
-        for idx, file in enumerate(os.listdir(dir_path)):
-            if file.endswith(".tcx"):
-                exercise = self.parse_tcx_file(os.path.join(dir_path, file))
-                exercise_val.append((exercise.start_time, exercise))
+        for idx, path in enumerate(list_tcx_sources(dir_path)):
+            exercise = self.parse_tcx_file(path)
+            exercise_val.append((exercise.start_time, exercise))
             if idx >= read_limit:
                 break
         return exercise_val
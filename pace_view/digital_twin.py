@@ -1,23 +1,104 @@
 """
-Random-forest based digital twin for physiological response modeling.
+Digital twin for physiological response modeling with pluggable regressor backends.
 """
 
-from sklearn.ensemble import RandomForestRegressor
+import hashlib
+import json
+import joblib
+from sklearn.ensemble import HistGradientBoostingRegressor, RandomForestRegressor
+from sklearn.linear_model import LinearRegression, Ridge
+from sklearn.pipeline import make_pipeline
+from sklearn.preprocessing import SplineTransformer, StandardScaler
+
+# Hyperparameters that change speed/logging but not the fitted model.
+_RUNTIME_PARAMS = ("n_jobs", "verbose")
+
+# Backend name -> estimator factory. All backends share the same feature list.
+BACKENDS = {
+    "random_forest": lambda: RandomForestRegressor(n_estimators=100, max_depth=15, n_jobs=-1),
+    "hist_gradient_boosting": lambda: HistGradientBoostingRegressor(
+        max_iter=200, learning_rate=0.1, max_leaf_nodes=31, early_stopping=False
+    ),
+    "spline_ridge": lambda: make_pipeline(SplineTransformer(n_knots=6, degree=3), Ridge(alpha=1.0)),
+    "linear": lambda: make_pipeline(StandardScaler(), LinearRegression()),
+}
+
+# Backends that can grow on new data with warm_start, and the size parameter that grows.
+_WARM_START_PARAM = {"random_forest": "n_estimators", "hist_gradient_boosting": "max_iter"}
 
 
 class DigitalTwinModel:
     """
     Fits a digital twin that predicts heart rate from physics and environment.
+
+    ``backend`` selects the regressor from `BACKENDS` (default: random forest).
     """
-    def __init__(self):
-        self.model = RandomForestRegressor(n_estimators=100, max_depth=15, n_jobs=-1)
+    def __init__(self, backend="random_forest"):
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown backend {backend!r}; choose from {sorted(BACKENDS)}")
+        self.backend = backend
+        self.model = BACKENDS[backend]()
         self.is_trained = False
+        self.score = None
+        # Configured hyperparameters; update() grows n_estimators without changing the configuration.
+        self.params = self.model.get_params()
         # wind_speed_mps and wind_dir are implicitly included via virtual_power
         self.features = ["virtual_power", "speed_mps", "dist", "temp", "ele", "hum"]
 
-    def train(self, df_history):
+    def fingerprint(self, training_key):
         """
-        Trains the Digital Twin model to predict heart rate from physics and environment.
+        Hash of the training set description, feature list, and model hyperparameters.
+        """
+        params = {
+            k: v for k, v in self.params.items()
+            if k.rsplit("__", 1)[-1] not in _RUNTIME_PARAMS and not hasattr(v, "get_params")
+        }
+        payload = {
+            "training": training_key,
+            "features": self.features,
+            "backend": self.backend,
+            "estimator": type(self.model).__name__,
+            "params": params,
+        }
+        return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+    def save(self, path, fingerprint=None):
+        """
+        Persist the trained model with its features and training fingerprint.
+        """
+        if not self.is_trained:
+            raise Exception("Model not trained.")
+        joblib.dump(
+            {
+                "model": self.model,
+                "backend": self.backend,
+                "features": self.features,
+                "params": self.params,
+                "score": self.score,
+                "fingerprint": fingerprint,
+            },
+            path,
+        )
+
+    def load(self, path, expected_fingerprint=None):
+        """
+        Load a model saved with `save` into this instance and return its fingerprint.
+        If ``expected_fingerprint`` is given and differs, nothing is loaded and None is returned.
+        """
+        state = joblib.load(path)
+        if expected_fingerprint is not None and state.get("fingerprint") != expected_fingerprint:
+            return None
+        self.model = state["model"]
+        self.backend = state.get("backend", "random_forest")
+        self.features = state["features"]
+        self.params = state.get("params", self.model.get_params())
+        self.score = state.get("score")
+        self.is_trained = True
+        return state.get("fingerprint")
+
+    def _training_matrix(self, df_history):
+        """
+        Select clean, downsampled (X, y) rows for fitting.
         """
         numeric_cols = df_history.select_dtypes(include=["number"]).columns
         if "hr" not in numeric_cols:
@@ -30,12 +111,48 @@ class DigitalTwinModel:
 
         df_resampled = df_clean.iloc[::30]  # Downsample to every 30th second
 
-        X = df_resampled[self.features]
-        y = df_resampled["hr"]
+        return df_resampled[self.features], df_resampled["hr"]
+
+    def train(self, df_history):
+        """
+        Trains the Digital Twin model to predict heart rate from physics and environment.
+        """
+        X, y = self._training_matrix(df_history)
 
+        self.model.set_params(**self.params)  # Drop trees added by update()
         self.model.fit(X, y)
         self.is_trained = True
-        return self.model.score(X, y)
+        self.score = self.model.score(X, y)
+        return self.score
+
+    @property
+    def supports_update(self):
+        """
+        Whether the backend can be grown incrementally with `update`.
+        """
+        return self.backend in _WARM_START_PARAM
+
+    def update(self, df_new, n_new_trees=10):
+        """
+        Incrementally adds trees (or boosting iterations) fitted on new rides only
+        (warm start); the existing ones are kept. Returns the R2 score on the new data.
+        """
+        if not self.is_trained:
+            return self.train(df_new)
+        if not self.supports_update:
+            raise ValueError(f"Backend {self.backend!r} does not support incremental updates.")
+
+        X, y = self._training_matrix(df_new)
+        if len(X) < 2:
+            return self.score
+
+        size_param = _WARM_START_PARAM[self.backend]
+        grown = self.model.get_params()[size_param] + n_new_trees
+        self.model.set_params(warm_start=True, **{size_param: grown})
+        self.model.fit(X, y)
+        self.model.set_params(warm_start=False)
+        self.score = self.model.score(X, y)
+        return self.score
 
     def predict(self, df_new):
         """
@@ -0,0 +1,54 @@
+"""
+Memoization of dashboard figures across callback invocations.
+"""
+
+from collections import OrderedDict
+import hashlib
+import pandas as pd
+
+
+def data_version(df):
+    """
+    Content hash of a dataframe, usable as the data version of a figure cache key.
+    """
+    hashed = pd.util.hash_pandas_object(df, index=True).to_numpy()
+    columns = "\x1f".join(map(str, df.columns)).encode("utf-8")
+    return hashlib.sha1(columns + hashed.tobytes()).hexdigest()
+
+
+class FigureCache:
+    """
+    Keeps finished figures keyed by (data version, figure, params).
+
+    Figures are built once, passed through the optional ``theme`` callable, and
+    stored as plain figure dicts, so repeated callbacks return them without
+    recomputing statistics or re-theming. The least recently used entries are
+    dropped beyond ``max_entries``.
+    """
+    def __init__(self, theme=None, max_entries=64):
+        self.theme = theme
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+
+    def get(self, version, figure, params, build):
+        """
+        Return the cached figure dict for the key, calling ``build()`` on a miss.
+        """
+        key = (version, figure, params)
+        if key in self._entries:
+            self._entries.move_to_end(key)
+            return self._entries[key]
+
+        fig = build()
+        if self.theme is not None:
+            fig = self.theme(fig)
+        self._entries[key] = fig.to_dict()
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        return self._entries[key]
+
+    def clear(self):
+        """
+        Drop all cached figures.
+        """
+        self._entries.clear()
@@ -0,0 +1,167 @@
+"""
+Columnar, per-activity storage of the analyzed ride history.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import numpy as np
+import pandas as pd
+from .utils import atomic_write
+
+HISTORY_STORE_DIRNAME = "history_store"
+STORE_VERSION = 1
+
+
+class HistoryStore:
+    """
+    Stores the per-second history as one partition per activity.
+
+    Each partition is a folder with one `.npy` file per column, so readers can
+    memory-map just the columns they need. A JSON manifest keeps the partition
+    order, row counts, and column dtypes; appending rides writes their partitions
+    and rewrites only the manifest, once per `extend` call.
+    """
+    def __init__(self, root):
+        self.root = root
+        self.manifest_path = os.path.join(root, "manifest.json")
+
+    @classmethod
+    def for_folder(cls, folder):
+        """
+        Create a store that lives inside the given history folder.
+        """
+        return cls(os.path.join(folder, HISTORY_STORE_DIRNAME))
+
+    def _load_manifest(self):
+        try:
+            with open(self.manifest_path, encoding="utf-8") as handle:
+                manifest = json.load(handle)
+        except (OSError, ValueError):
+            return {"version": STORE_VERSION, "partitions": []}
+        if manifest.get("version") != STORE_VERSION:
+            return {"version": STORE_VERSION, "partitions": []}
+        return manifest
+
+    def _save_manifest(self, manifest):
+        os.makedirs(self.root, exist_ok=True)
+
+        def write(tmp_path):
+            with open(tmp_path, "w", encoding="utf-8") as handle:
+                json.dump(manifest, handle, indent=1)
+
+        atomic_write(self.manifest_path, write)
+
+    def _partition_dir(self, activity_id):
+        digest = hashlib.sha1(str(activity_id).encode("utf-8")).hexdigest()[:16]
+        return os.path.join(self.root, digest)
+
+    def exists(self):
+        """
+        Whether the store has at least one partition.
+        """
+        return bool(self._load_manifest()["partitions"])
+
+    def activity_ids(self):
+        """
+        Return stored activity ids in insertion order.
+        """
+        return [p["id"] for p in self._load_manifest()["partitions"]]
+
+    def columns(self):
+        """
+        Return the column names of the first partition (all partitions share a schema).
+        """
+        partitions = self._load_manifest()["partitions"]
+        return list(partitions[0]["columns"]) if partitions else []
+
+    def _write_partition(self, activity_id, df):
+        """
+        Write one partition folder and return its manifest entry.
+        """
+        part_dir = self._partition_dir(activity_id)
+        tmp_dir = f"{part_dir}.{os.getpid()}.tmp"
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        os.makedirs(tmp_dir)
+
+        columns = {}
+        for i, col in enumerate(df.columns):
+            values = df[col]
+            if values.dtype == object or isinstance(values.dtype, pd.StringDtype):
+                values = values.astype(str)
+            arr = np.asarray(values.to_numpy())
+            np.save(os.path.join(tmp_dir, f"c{i}.npy"), arr, allow_pickle=False)
+            columns[str(col)] = {"file": f"c{i}.npy", "dtype": arr.dtype.str}
+
+        shutil.rmtree(part_dir, ignore_errors=True)
+        os.replace(tmp_dir, part_dir)
+        return {"id": activity_id, "dir": os.path.basename(part_dir), "rows": int(len(df)), "columns": columns}
+
+    def append(self, activity_id, df):
+        """
+        Write (or replace) one activity partition without touching the others.
+        """
+        self.extend([(activity_id, df)])
+
+    def extend(self, items):
+        """
+        Write (or replace) the partitions of many (activity_id, dataframe) pairs,
+        updating the manifest once at the end.
+        """
+        manifest = self._load_manifest()
+        entries = {}
+        for activity_id, df in items:
+            entries.pop(activity_id, None)
+            entries[activity_id] = self._write_partition(activity_id, df)
+        if not entries:
+            return
+
+        partitions = [p for p in manifest["partitions"] if p["id"] not in entries]
+        partitions.extend(entries.values())
+        manifest["partitions"] = partitions
+        self._save_manifest(manifest)
+
+    def remove(self, activity_id):
+        """
+        Drop one activity partition.
+        """
+        manifest = self._load_manifest()
+        manifest["partitions"] = [p for p in manifest["partitions"] if p["id"] != activity_id]
+        shutil.rmtree(self._partition_dir(activity_id), ignore_errors=True)
+        self._save_manifest(manifest)
+
+    def clear(self):
+        """
+        Remove all partitions.
+        """
+        shutil.rmtree(self.root, ignore_errors=True)
+
+    def iter_partitions(self, columns=None, activity_ids=None):
+        """
+        Yield (activity_id, dataframe) per partition, memory-mapping only the requested columns.
+        """
+        wanted = set(activity_ids) if activity_ids is not None else None
+        for part in self._load_manifest()["partitions"]:
+            if wanted is not None and part["id"] not in wanted:
+                continue
+            names = list(part["columns"]) if columns is None else list(columns)
+            missing = [c for c in names if c not in part["columns"]]
+            if missing:
+                raise KeyError(f"Columns {missing} not stored for activity {part['id']!r}")
+
+            part_dir = os.path.join(self.root, part["dir"])
+            data = {
+                c: np.load(os.path.join(part_dir, part["columns"][c]["file"]), mmap_mode="r", allow_pickle=False)
+                for c in names
+            }
+            yield part["id"], pd.DataFrame(data, columns=names)
+
+    def read(self, columns=None, activity_ids=None):
+        """
+        Load the history (optionally a subset of columns/activities) as one dataframe.
+        """
+        frames = [df for _, df in self.iter_partitions(columns=columns, activity_ids=activity_ids)]
+        if not frames:
+            return pd.DataFrame(columns=list(columns) if columns is not None else [])
+        return pd.concat(frames, ignore_index=True)
@@ -2,18 +2,109 @@
 Pattern mining for high-level behavioral rules from historical rides.
 """
 
-import os
+import itertools
+import numpy as np
 import pandas as pd
-from niaarm import Dataset, get_rules
+from niaarm.feature import Feature
+from niaarm.rule import Rule
 from niapy.algorithms.basic import DifferentialEvolution
+from niapy.problems import Problem
+from niapy.task import OptimizationType, Task
+
+
+def _weighted_rule_metrics(antecedent, consequent, transactions, weights):
+    """
+    Support, confidence, and lift of a rule over unique transactions with a count per row.
+    ``antecedent`` and ``consequent`` are lists of categorical `Feature`s.
+    """
+    def contains(features):
+        mask = np.ones(len(transactions), dtype=bool)
+        for feature in features:
+            mask &= transactions[feature.name].isin(feature.categories).to_numpy()
+        return mask
+
+    weights = np.asarray(weights, dtype=float)
+    total = weights.sum()
+    contains_antecedent = contains(antecedent)
+    contains_consequent = contains(consequent)
+    antecedent_count = weights[contains_antecedent].sum()
+    full_count = weights[contains_antecedent & contains_consequent].sum()
+    rhs_support = weights[contains_consequent].sum() / total
+
+    confidence = full_count / antecedent_count if antecedent_count > 0 else 0.0
+    return {
+        "support": full_count / total,
+        "confidence": confidence,
+        "lift": confidence / rhs_support if rhs_support > 0 else 0.0,
+    }
+
+
+class _RuleSearch(Problem):
+    """
+    Association rules over categorical features as a niapy problem, scored on weighted transactions.
+
+    Encoding as in NiaARM: per feature a value and a threshold gene (the feature is used
+    when value > threshold, with the category picked by value), then one gene per feature
+    ordering them, and a last gene cutting the ordered features into antecedent and
+    consequent. Fitness is the mean of support and confidence.
+    """
+    def __init__(self, features, transactions, weights):
+        self.features = features
+        super().__init__(dimension=3 * len(features) + 1, lower=0.0, upper=1.0)
+        self.transactions = transactions
+        self.transaction_weights = np.asarray(weights, dtype=float)
+        self.rules = {}
+
+    def decode(self, x):
+        """
+        Return the (antecedent, consequent) feature lists of a solution vector.
+        """
+        n = len(self.features)
+        order = sorted(range(n), key=lambda k: x[2 * n + k])
+        chosen = []
+        for i in order:
+            value, threshold = x[2 * i], x[2 * i + 1]
+            if value > threshold:
+                feature = self.features[i]
+                category = feature.categories[int(round(value * (len(feature.categories) - 1)))]
+                chosen.append(Feature(feature.name, "cat", categories=[category]))
+            else:
+                chosen.append(None)
+
+        cut = min(max(int(x[-1] * n), 1), n - 1)
+        return [f for f in chosen[:cut] if f], [f for f in chosen[cut:] if f]
+
+    def _evaluate(self, x):
+        antecedent, consequent = self.decode(x)
+        if not antecedent or not consequent:
+            return -1.0
+
+        metrics = _weighted_rule_metrics(antecedent, consequent, self.transactions, self.transaction_weights)
+        fitness = (metrics["support"] + metrics["confidence"]) / 2
+        if metrics["support"] > 0 and metrics["confidence"] > 0:
+            rule = str(Rule(antecedent, consequent))
+            self.rules.setdefault(rule, {"rule": rule, **metrics, "fitness": fitness, "consequent": consequent})
+        return fitness
 
 
 class PatternMiner:
     """
     Mines human-readable rules that explain performance patterns.
+
+    ``method="exact"`` enumerates every antecedent over the categorical columns,
+    ``"niaarm"`` runs Differential Evolution, and ``"auto"`` enumerates unless there
+    are more than ``max_exact_antecedents`` candidate antecedents.
     """
-    def __init__(self):
-        pass
+    # History columns read by _discretize
+    required_columns = ["headwind_mps", "grad", "drift"]
+
+    methods = ("auto", "exact", "niaarm")
+
+    def __init__(self, method="auto", max_exact_antecedents=4096):
+        if method not in self.methods:
+            raise ValueError(f"Unknown mining method {method!r}; expected one of {self.methods}")
+        self.method = method
+        self.max_exact_antecedents = max_exact_antecedents
 
     def _discretize(self, df):
         """
@@ -39,9 +130,19 @@ class PatternMiner:
 
         return data.dropna()
 
+    def _weighted_transactions(self, discrete_df):
+        """
+        Collapse identical discretized rows into unique transactions and their counts.
+        With three small categorical columns this is at most a few dozen rows,
+        however long the history is.
+        """
+        counts = discrete_df.astype(str).value_counts(sort=False)
+        transactions = counts.index.to_frame(index=False)
+        return transactions, counts.to_numpy()
+
     def _summarize_rules(self, rules):
         """
-        Turn raw rule strings into a dashboard-friendly report.
+        Turn mined rules (dicts with rule, support, confidence, lift) into a dashboard-friendly report.
         """
         explanation = (
             "Patterns are mined from discretized wind, terrain, and drift signals and filtered to explain struggling episodes."
@@ -58,23 +159,104 @@ class PatternMiner:
 
         insights = []
         for rule in rules[:5]:
-            insights.append(f"Rule indicates struggling when {rule}")
+            insights.append(
+                f"Rule indicates struggling when {rule['rule']} "
+                f"(confidence {rule['confidence']:.0%}, lift {rule['lift']:.2f})"
+            )
 
         return {
             "Analysis": "Pattern Mining Report",
             "Summary": f"Discovered {len(rules)} candidate rules.",
-            "Top_Rules": rules[:10],
+            "Top_Rules": [rule["rule"] for rule in rules[:10]],
+            "Rule_Metrics": rules[:10],
             "Insights": insights,
             "Explanation": explanation,
         }
 
-    def discover_rules(self, full_history_df):
+    def _antecedent_space_size(self, transactions):
         """
-        Uses Nature-Inspired Algorithms to find patterns in the athlete's data / .tcx files.
-        Returns a report with insights for the dashboard.
+        Number of candidate antecedents: each non-status column is left out or fixed to one category.
         """
-        print("Mining for pattern rules using Differential Evolution...")
+        sizes = [transactions[c].nunique() + 1 for c in transactions.columns if c != "Status"]
+        return int(np.prod(sizes)) - 1
 
+    def _mine_exact(self, transactions, weights):
+        """
+        Enumerate every antecedent => Status(Struggling) rule and score them all at once.
+        Returns rule dicts (rule, support, confidence, lift), best first.
+        """
+        antecedent_cols = [c for c in transactions.columns if c != "Status"]
+        categories = [sorted(transactions[c].unique()) for c in antecedent_cols]
+        codes = np.column_stack(
+            [pd.Categorical(transactions[c], categories=cats).codes for c, cats in zip(antecedent_cols, categories)]
+        ) if antecedent_cols else np.empty((len(transactions), 0), dtype=int)
+
+        # One row per antecedent; -1 leaves the column out. The first row (all -1) is the empty antecedent.
+        grid = np.array(
+            list(itertools.product(*[range(-1, len(cats)) for cats in categories])), dtype=int
+        ).reshape(-1, len(antecedent_cols))[1:]
+        matches = ((grid[:, None, :] == -1) | (grid[:, None, :] == codes[None, :, :])).all(axis=2)
+
+        weights = np.asarray(weights, dtype=float)
+        struggling = weights * (transactions["Status"] == "Struggling").to_numpy()
+        total = weights.sum()
+        antecedent_count = matches @ weights
+        full_count = matches @ struggling
+        rhs_support = struggling.sum() / total
+
+        support = full_count / total
+        confidence = np.divide(full_count, antecedent_count, out=np.zeros_like(full_count), where=antecedent_count > 0)
+        lift = confidence / rhs_support if rhs_support > 0 else np.zeros_like(confidence)
+
+        # Same fitness as the NiaARM search (mean of support and confidence), ties broken by lift.
+        fitness = (support + confidence) / 2
+        order = [i for i in np.lexsort((-lift, -fitness)) if full_count[i] > 0]
+
+        rules = []
+        for i in order:
+            antecedent = ", ".join(
+                f"{col}({cats[code]})" for col, cats, code in zip(antecedent_cols, categories, grid[i]) if code >= 0
+            )
+            rules.append({
+                "rule": f"[{antecedent}] => [Status(Struggling)]",
+                "support": float(support[i]),
+                "confidence": float(confidence[i]),
+                "lift": float(lift[i]),
+            })
+        return rules
+
+    def _mine_niaarm(self, transactions, weights):
+        """
+        Search rules with Differential Evolution and keep those whose consequent is Struggling.
+        """
+        # Only the categories actually observed are searched; rule metrics are weighted by the row counts.
+        features = [Feature(col, "cat", categories=sorted(transactions[col].unique())) for col in transactions.columns]
+
+        # Configure algorithm (Differential Evolution)
+        algo = DifferentialEvolution(
+            population_size=50,
+            differential_weight=0.5,
+            crossover_probability=0.9,
+        )
+
+        problem = _RuleSearch(features, transactions, weights)
+        task = Task(problem, max_iters=50, optimization_type=OptimizationType.MAXIMIZATION)
+        algo.run(task)
+        found = sorted(problem.rules.values(), key=lambda rule: rule["fitness"], reverse=True)
+
+        # Check if each rule explains why we are struggling (Struggling in the consequent)
+        return [
+            {key: (rule[key] if key == "rule" else float(rule[key])) for key in ("rule", "support", "confidence", "lift")}
+            for rule in found
+            if any("Struggling" in feature.categories for feature in rule["consequent"])
+        ]
+
+    def discover_rules(self, full_history_df):
+        """
+        Finds rules that explain struggling episodes in the athlete's data / .tcx files.
+        Small categorical spaces are enumerated exactly; larger ones fall back to
+        Nature-Inspired Algorithms (NiaARM). Returns a report with insights for the dashboard.
+        """
         # 1. Prepare data
         discrete_df = self._discretize(full_history_df)
 
@@ -82,46 +264,25 @@ class PatternMiner:
             print("No valid data for mining.")
             return self._summarize_rules([])
 
-        # 2. Create dataset file for NiaARM
-        temp_file = "temp_mining_data.csv"
-        discrete_df.to_csv(temp_file, index=False)
-
         try:
-            # Load dataset using NiaARM's loader
-            dataset = Dataset(temp_file)
-
-            # 3. Configure algorithm (Differential Evolution)
-            algo = DifferentialEvolution(
-                population_size=50,
-                differential_weight=0.5,
-                crossover_probability=0.9,
-            )
+            # 2. Collapse identical rows into unique transactions with counts
+            transactions, weights = self._weighted_transactions(discrete_df)
 
-            # 4. Run mining
-            rules, run_time = get_rules(
-                dataset,
-                algo,
-                metrics=("support", "confidence"),
-                max_iters=50,
-                logging=False,
-            )
-
-            # 5. Filter for "Struggling" rules
-            interesting_patterns = []
-            for rule in rules:
-                rule_str = str(rule)
+            # 3. Enumerate when the antecedent space is small enough, otherwise search it
+            method = self.method
+            if method == "auto":
+                n_antecedents = self._antecedent_space_size(transactions)
+                method = "exact" if n_antecedents <= self.max_exact_antecedents else "niaarm"
 
-                # Check if this rule explains why we are struggling
-                if "Struggling" in rule_str and "THEN" in rule_str:
-                    if rule_str.split("THEN")[1].find("Struggling") != -1:  # Verify consequent
-                        interesting_patterns.append(rule_str)
+            if method == "exact":
+                print("Mining for pattern rules by exhaustive enumeration...")
+                rules = self._mine_exact(transactions, weights)
+            else:
+                print("Mining for pattern rules using Differential Evolution...")
+                rules = self._mine_niaarm(transactions, weights)
 
-            return self._summarize_rules(interesting_patterns)
+            return self._summarize_rules(rules)
 
         except Exception as e:
             print(f"Mining failed: {e}")
             return self._summarize_rules([])
-
-        finally:
-            if os.path.exists(temp_file):  # Cleanup temp file
-                os.remove(temp_file)
\ No newline at end of file
@@ -10,6 +10,13 @@ class PhysicsEngine:
     """
     Computes virtual power and related physics signals from ride data.
     """
+    # Intermediate columns left on the frame that no later stage reads
+    scratch_columns = ("prev_lat", "prev_lon", "ele_smooth")
+    # Input columns of the batch kernel and the columns it produces
+    batch_inputs = ("lat", "lon", "ele", "dist", "speed_mps", "wind_speed_mps", "wind_dir")
+    batch_outputs = ("bearing", "headwind_mps", "ele_smooth", "grad", "p_aero", "p_grav", "p_roll", "virtual_power")
+    smoothing_window = 10
+
     def __init__(self, rider_mass=75, bike_mass=10):
         self.mass = rider_mass + bike_mass
         self.g = 9.81
@@ -56,3 +63,204 @@ class PhysicsEngine:
         df["virtual_power"] = (p_aero + p_grav + p_roll).clip(lower=0)  # Total virtual power
 
         return df
+
+    def batch_virtual_power(self, columns, offsets):
+        """
+        Physics features for many rides stored back to back.
+
+        ``columns`` maps each name in `batch_inputs` to one concatenated array (a
+        dataframe works too) and ``offsets`` holds the ride start positions plus the
+        total length, e.g. ``[0, n1, n1 + n2]``. Returns a dict of `batch_outputs`
+        arrays. Shifts, smoothing, differences, and bearing back-fill never cross a
+        ride boundary, so each ride matches `calculate_virtual_power` on its own.
+        """
+        arrays = {name: np.asarray(columns[name], dtype=float) for name in self.batch_inputs}
+        offsets = np.asarray(offsets, dtype=np.int64)
+        n = len(arrays["lat"])
+        if len(offsets) < 2 or offsets[0] != 0 or offsets[-1] != n or np.any(np.diff(offsets) < 0):
+            raise ValueError("offsets must run from 0 to the number of rows in ascending order")
+
+        out = {name: np.empty(n) for name in self.batch_outputs}
+        if n == 0:
+            return out
+
+        # Position of every row inside its ride; rows at position 0 have no predecessor.
+        lengths = np.diff(offsets)
+        ride_start = np.repeat(offsets[:-1], lengths)
+        position = np.arange(n) - ride_start
+        first = position == 0
+        scratch = np.empty(n)
+
+        # 1. Bearing from the previous point (NaN at ride starts), back-filled within each ride
+        lat = np.radians(arrays["lat"])
+        lon = np.radians(arrays["lon"])
+        lat1 = np.empty(n)
+        lat1[0] = np.nan
+        lat1[1:] = lat[:-1]
+        lat1[first] = np.nan
+        d_lon = np.empty(n)
+        d_lon[0] = np.nan
+        np.subtract(lon[1:], lon[:-1], out=d_lon[1:])
+        d_lon[first] = np.nan
+
+        cos_lat2 = np.cos(lat)
+        x = np.sin(d_lon)
+        x *= cos_lat2
+        y = np.cos(lat1)
+        y *= np.sin(lat)
+        np.multiply(np.sin(lat1), cos_lat2, out=scratch)
+        scratch *= np.cos(d_lon)
+        y -= scratch
+        bearing = out["bearing"]
+        np.arctan2(x, y, out=bearing)
+        np.degrees(bearing, out=bearing)
+        bearing += 360
+        np.remainder(bearing, 360, out=bearing)
+
+        missing = np.isnan(bearing)
+        if missing.any():
+            next_valid = np.where(missing, n, np.arange(n))
+            next_valid = np.minimum.accumulate(next_valid[::-1])[::-1]
+            ride_end = np.repeat(offsets[1:], lengths)
+            fill = missing & (next_valid < ride_end)
+            bearing[fill] = bearing[next_valid[fill]]
+
+        # 2. Headwind component along the direction of travel
+        headwind = out["headwind_mps"]
+        np.subtract(arrays["wind_dir"], bearing, out=headwind)
+        np.radians(headwind, out=headwind)
+        np.cos(headwind, out=headwind)
+        headwind *= arrays["wind_speed_mps"]
+
+        # 3. Trailing mean of the last `smoothing_window` elevations (NaNs skipped) within each ride
+        ele = arrays["ele"]
+        total = np.zeros(n)
+        count = np.zeros(n)
+        for lag in range(self.smoothing_window):
+            rows = np.flatnonzero(position >= lag)
+            values = ele[rows - lag]
+            present = ~np.isnan(values)
+            total[rows[present]] += values[present]
+            count[rows[present]] += 1
+        ele_smooth = out["ele_smooth"]
+        np.divide(total, count, out=ele_smooth, where=count > 0)
+        ele_smooth[count == 0] = np.nan
+
+        # 4. Gradient from consecutive smoothed elevation and distance, clipped to +-25%
+        grad = out["grad"]
+        grad[0] = np.nan
+        np.subtract(ele_smooth[1:], ele_smooth[:-1], out=grad[1:])
+        scratch[0] = np.nan
+        np.subtract(arrays["dist"][1:], arrays["dist"][:-1], out=scratch[1:])
+        with np.errstate(divide="ignore", invalid="ignore"):
+            grad /= scratch
+        grad[first] = np.nan
+        grad[np.isnan(grad)] = 0.0
+        np.clip(grad, -0.25, 0.25, out=grad)
+
+        # 5. Power terms
+        speed = arrays["speed_mps"]
+        p_aero = out["p_aero"]
+        np.add(speed, headwind, out=p_aero)  # Effective airspeed
+        np.square(p_aero, out=p_aero)
+        p_aero *= 0.5 * self.rho * self.cd_a
+        p_aero *= speed
+
+        np.arctan(grad, out=scratch)
+        p_grav = out["p_grav"]
+        np.sin(scratch, out=p_grav)
+        p_grav *= self.mass * self.g
+        p_grav *= speed
+        p_roll = out["p_roll"]
+        np.cos(scratch, out=p_roll)
+        p_roll *= self.mass * self.g * 0.005
+        p_roll *= speed
+
+        power = out["virtual_power"]
+        np.add(p_aero, p_grav, out=power)
+        power += p_roll
+        np.maximum(power, 0, out=power, where=~np.isnan(power))
+        return out
+
+    def calculate_history(self, frames):
+        """
+        Concatenate cleaned ride frames and add the physics columns with one batch pass.
+        """
+        frames = [df for df in frames if df is not None]
+        offsets = np.concatenate(([0], np.cumsum([len(df) for df in frames]))).astype(np.int64)
+        history = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=list(self.batch_inputs))
+        for name, values in self.batch_virtual_power(history, offsets).items():
+            history[name] = values
+        return history
+
+    def calculate_rides(self, frames):
+        """
+        Add the physics columns to each cleaned ride frame in place, with one batch pass over all of them.
+        Unlike `calculate_history` the rides stay separate frames; returns ``frames``.
+        """
+        if not frames:
+            return frames
+        offsets = np.concatenate(([0], np.cumsum([len(df) for df in frames]))).astype(np.int64)
+        columns = {
+            name: np.concatenate([df[name].to_numpy(dtype=float) for df in frames]) for name in self.batch_inputs
+        }
+        for name, values in self.batch_virtual_power(columns, offsets).items():
+            for df, start, end in zip(frames, offsets[:-1], offsets[1:]):
+                df[name] = values[start:end]
+        return frames
+
+
+class StreamingPhysics:
+    """
+    Online counterpart of `PhysicsEngine.batch_virtual_power` for one ride fed in chunks.
+
+    Only the last `smoothing_window` input rows are kept as context (enough for the
+    previous point, the elevation window, and the previous gradient step), plus
+    trailing rows whose bearing may still be back-filled by a later point. `push`
+    returns the rows that are final so far and `flush` the rest once the ride ends;
+    together they are bit-identical to the batch kernel over the whole ride.
+    """
+    def __init__(self, engine=None):
+        self.engine = engine or PhysicsEngine()
+        self.window = self.engine.smoothing_window
+        self._context = pd.DataFrame()  # Last emitted input rows
+        self._pending = pd.DataFrame()  # Input rows held back until their bearing is known
+
+    def _process(self, chunk, final):
+        parts = [p for p in (self._context, self._pending, chunk) if len(p)]
+        if not parts:
+            return pd.DataFrame()
+        buffer = pd.concat(parts, ignore_index=True)
+        n_context = len(self._context)
+
+        # The context rows are recomputed as if the ride started there; only their successors are used.
+        rows = buffer.iloc[n_context:].reset_index(drop=True)
+        for name, values in self.engine.batch_virtual_power(buffer, [0, len(buffer)]).items():
+            rows[name] = values[n_context:]
+
+        ready = len(rows)
+        if not final:
+            # A trailing run of NaN bearings can still be back-filled by the next valid point.
+            valid = np.flatnonzero(~np.isnan(rows["bearing"].to_numpy()))
+            ready = int(valid[-1]) + 1 if len(valid) else 0
+
+        cut = n_context + ready
+        self._context = buffer.iloc[max(0, cut - self.window):cut].reset_index(drop=True)
+        self._pending = buffer.iloc[cut:].reset_index(drop=True)
+        return rows.iloc[:ready]
+
+    def push(self, chunk):
+        """
+        Add the next trackpoints (a dataframe with `batch_inputs` columns; other
+        columns are passed through) and return the rows whose features are final.
+        """
+        return self._process(pd.DataFrame(chunk).reset_index(drop=True), final=False)
+
+    def flush(self):
+        """
+        End the ride and return the rows still held back (a bearing that is NaN here is NaN in the batch path too).
+        """
+        rows = self._process(pd.DataFrame(), final=True)
+        self._context = pd.DataFrame()
+        self._pending = pd.DataFrame()
+        return rows
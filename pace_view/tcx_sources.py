@@ -0,0 +1,119 @@
+"""
+Locating and opening TCX inputs: plain, gzip- or bz2-compressed, and members of zip archives.
+"""
+
+import bz2
+import gzip
+import os
+import zipfile
+from contextlib import ExitStack, contextmanager
+
+TCX_SUFFIXES = (".tcx", ".tcx.gz", ".tcx.bz2")
+ARCHIVE_SUFFIXES = (".zip",)
+
+
+def is_tcx_name(name):
+    """
+    Whether a file or archive member name is a (possibly compressed) TCX file.
+    """
+    return name.lower().endswith(TCX_SUFFIXES)
+
+
+def split_archive_path(path):
+    """
+    Split ``archive.zip/member.tcx`` into (archive path, member name); other paths give (path, None).
+    """
+    path = os.fspath(path)
+    if ".zip" not in path.lower() or os.path.isfile(path):
+        return path, None
+
+    parts = path.replace(os.sep, "/").split("/")
+    for i in range(len(parts) - 1, 0, -1):
+        archive = "/".join(parts[:i])
+        if archive.lower().endswith(ARCHIVE_SUFFIXES) and os.path.isfile(archive):
+            return archive, "/".join(parts[i:])
+    return path, None
+
+
+def source_name(path):
+    """
+    Activity name of an input: the file name, or ``archive.zip/member`` for archive members.
+    """
+    archive, member = split_archive_path(path)
+    if member is None:
+        return os.path.basename(archive)
+    return f"{os.path.basename(archive)}/{member}"
+
+
+def source_exists(path):
+    """
+    Whether an input path (file or archive member) exists.
+    """
+    archive, member = split_archive_path(path)
+    if member is None:
+        return os.path.isfile(archive)
+    try:
+        with zipfile.ZipFile(archive) as bundle:
+            bundle.getinfo(member)
+        return True
+    except (KeyError, OSError, zipfile.BadZipFile):
+        return False
+
+
+def list_tcx_sources(folder):
+    """
+    TCX inputs of a folder in sorted order: plain and compressed files, followed in
+    place by the TCX members of each zip archive (as ``archive.zip/member`` paths).
+    """
+    sources = []
+    for name in sorted(os.listdir(folder)):
+        path = os.path.join(folder, name)
+        if is_tcx_name(name):
+            sources.append(path)
+        elif name.lower().endswith(ARCHIVE_SUFFIXES) and zipfile.is_zipfile(path):
+            with zipfile.ZipFile(path) as bundle:
+                members = sorted(m for m in bundle.namelist() if is_tcx_name(m))
+            sources.extend(f"{path}/{member}" for member in members)
+    return sources
+
+
+@contextmanager
+def open_tcx(source):
+    """
+    Open a TCX input for binary reading, decompressing on the fly without temp files.
+
+    ``source`` is a path (see `list_tcx_sources`) or an already open binary file object,
+    which is passed through unchanged.
+    """
+    if not isinstance(source, (str, os.PathLike)):
+        yield source
+        return
+
+    archive, member = split_archive_path(source)
+    with ExitStack() as stack:
+        if member is None:
+            handle = stack.enter_context(open(archive, "rb"))
+            name = archive
+        else:
+            bundle = stack.enter_context(zipfile.ZipFile(archive))
+            handle = stack.enter_context(bundle.open(member))
+            name = member
+
+        name = name.lower()
+        if name.endswith(".gz"):
+            handle = stack.enter_context(gzip.GzipFile(fileobj=handle, mode="rb"))
+        elif name.endswith(".bz2"):
+            handle = stack.enter_context(bz2.BZ2File(handle, mode="rb"))
+        yield handle
+
+
+def zip_member_key(path):
+    """
+    Content identity of an archive member from the zip directory (name, CRC, size), or None for other paths.
+    """
+    archive, member = split_archive_path(path)
+    if member is None:
+        return None
+    with zipfile.ZipFile(archive) as bundle:
+        info = bundle.getinfo(member)
+    return f"{member}\x1f{info.CRC}\x1f{info.file_size}"
@@ -0,0 +1,198 @@
+"""
+Fitness, fatigue, and form (CTL/ATL/TSB) maintained as daily series.
+"""
+
+import numpy as np
+import pandas as pd
+from .utils import atomic_write, to_day
+
+
+class TrainingLoadModel:
+    """
+    Keeps the daily training load and its exponentially weighted averages.
+
+    Fitness (CTL) and fatigue (ATL) follow `DataCleaner.ewma_series` with
+    ``ctl_days`` and ``atl_days`` time constants over a gap-free daily series
+    (rest days count as zero load); form (TSB) is CTL minus ATL. Adding a ride
+    after the last stored day only extends the series by the days in between;
+    a back-dated ride recomputes from its day onward. ``rides`` holds the keys
+    (see `ride_key`) of the rides added so far, so a ride is never counted twice.
+    """
+    def __init__(self, ctl_days=42, atl_days=7, capacity=64):
+        self.ctl_days = ctl_days
+        self.atl_days = atl_days
+        self._alpha = np.array([2 / (ctl_days + 1), 2 / (atl_days + 1)])
+        capacity = max(1, int(capacity))
+        self._start = None
+        self._load = np.zeros(capacity)
+        self._state = np.zeros((capacity, 2))  # columns: ctl, atl
+        self._size = 0
+        self.rides = set()
+
+    @classmethod
+    def from_summary(cls, total_summary, load_column="trimp_bannister", ctl_days=42, atl_days=7):
+        """
+        Build the series from a summary dataframe with ``date`` and a per-ride load column.
+        """
+        if total_summary.empty:
+            return cls(ctl_days=ctl_days, atl_days=atl_days)
+
+        daily = total_summary.groupby(pd.to_datetime(total_summary["date"]).dt.floor("D"))[load_column].sum()
+        daily = daily.asfreq("D", fill_value=0)
+
+        model = cls(ctl_days=ctl_days, atl_days=atl_days, capacity=len(daily))
+        model._start = to_day(daily.index[0])
+        model._load[:len(daily)] = daily.to_numpy(dtype=float)
+        model._size = len(daily)
+        model._recompute(0)
+        model.rides = set(summary_ride_keys(total_summary))
+        return model
+
+    def __len__(self):
+        return self._size
+
+    @property
+    def last_day(self):
+        """
+        Last day covered by the series (None when empty).
+        """
+        return None if self._size == 0 else self._start + np.timedelta64(self._size - 1, "D")
+
+    def _reserve(self, size):
+        if size <= len(self._load):
+            return
+        capacity = max(size, 2 * len(self._load))
+        load = np.zeros(capacity)
+        state = np.zeros((capacity, 2))
+        load[:self._size] = self._load[:self._size]
+        state[:self._size] = self._state[:self._size]
+        self._load, self._state = load, state
+
+    def _recompute(self, first):
+        """
+        Re-run the EWMA recursion from day index ``first`` to the end.
+        """
+        alpha = self._alpha
+        load, state = self._load, self._state
+        if first == 0 and self._size:
+            state[0] = load[0]
+            first = 1
+        # Same update as pandas' adjust=False EWMA, so results match ewma_series.
+        for i in range(first, self._size):
+            state[i] = ((1 - alpha) * state[i - 1] + alpha * load[i]) / ((1 - alpha) + alpha)
+
+    def add(self, date, load, ride=None):
+        """
+        Add one ride's training load on ``date``. With a ``ride`` key already in `rides`
+        nothing changes; returns whether the ride was added.
+        """
+        if ride is not None:
+            if ride in self.rides:
+                return False
+            self.rides.add(ride)
+        day = to_day(date)
+        load = 0.0 if pd.isna(load) else float(load)
+
+        if self._size == 0:
+            self._start = day
+            self._load[0] = load
+            self._size = 1
+            self._recompute(0)
+            return True
+
+        pos = int((day - self._start) / np.timedelta64(1, "D"))
+        if pos < 0:
+            # Back-dated before the first day: shift everything right and recompute all.
+            shift = -pos
+            self._reserve(self._size + shift)
+            self._load[shift:self._size + shift] = self._load[:self._size].copy()
+            self._load[:shift] = 0.0
+            self._load[0] = load
+            self._start = day
+            self._size += shift
+            self._recompute(0)
+        elif pos >= self._size:
+            # Extend through the rest days up to the new ride.
+            old_size = self._size
+            self._reserve(pos + 1)
+            self._load[old_size:pos + 1] = 0.0
+            self._load[pos] = load
+            self._size = pos + 1
+            self._recompute(old_size)
+        else:
+            self._load[pos] += load
+            self._recompute(pos)
+        return True
+
+    def series(self, start=None, end=None):
+        """
+        Daily load, CTL, ATL, and TSB for days in [start, end] (either bound may be open).
+        """
+        lo, hi = 0, self._size
+        if self._size:
+            if start is not None:
+                lo = min(max(int((to_day(start) - self._start) / np.timedelta64(1, "D")), 0), self._size)
+            if end is not None:
+                hi = min(max(int((to_day(end) - self._start) / np.timedelta64(1, "D")) + 1, 0), self._size)
+        hi = max(hi, lo)
+
+        state = self._state[lo:hi]
+        days = self._start + np.arange(lo, hi) if self._size else np.empty(0, dtype="datetime64[D]")
+        return pd.DataFrame(
+            {
+                "load": self._load[lo:hi],
+                "ctl": state[:, 0],
+                "atl": state[:, 1],
+                "tsb": state[:, 0] - state[:, 1],
+            },
+            index=pd.DatetimeIndex(days.astype("datetime64[ns]"), name="date"),
+        )
+
+    def save(self, path):
+        """
+        Write the series to an `.npz` file.
+        """
+        def write(tmp_path):
+            with open(tmp_path, "wb") as handle:
+                np.savez(
+                    handle,
+                    start=np.datetime64("NaT", "D") if self._start is None else self._start,
+                    load=self._load[:self._size],
+                    state=self._state[:self._size],
+                    time_constants=np.array([self.ctl_days, self.atl_days]),
+                    rides=np.array(sorted(self.rides), dtype=str),
+                )
+
+        atomic_write(path, write)
+
+    @classmethod
+    def load(cls, path):
+        """
+        Read a series written by `save`.
+        """
+        with np.load(path, allow_pickle=False) as data:
+            ctl_days, atl_days = (int(v) for v in data["time_constants"])
+            load = data["load"]
+            model = cls(ctl_days=ctl_days, atl_days=atl_days, capacity=len(load))
+            model._load[:len(load)] = load
+            model._state[:len(load)] = data["state"]
+            model._size = len(load)
+            model._start = None if np.isnat(data["start"]) else data["start"][()]
+            model.rides = set(data["rides"].tolist()) if "rides" in data.files else set()
+        return model
+
+
+def ride_key(source_file, start_time):
+    """
+    Identity of a ride in a `TrainingLoadModel`: its source file and start time.
+    """
+    return f"{source_file}@{pd.Timestamp(start_time).isoformat()}"
+
+
+def summary_ride_keys(total_summary):
+    """
+    `ride_key` of every row of a summary dataframe (empty without source_file/start_time columns).
+    """
+    if total_summary.empty or not {"source_file", "start_time"} <= set(total_summary.columns):
+        return []
+    return [ride_key(f, t) for f, t in zip(total_summary["source_file"], total_summary["start_time"])]
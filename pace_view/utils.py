@@ -0,0 +1,30 @@
+"""
+Small helpers shared by the cache, store, and index modules.
+"""
+
+import os
+import numpy as np
+import pandas as pd
+
+CACHE_DIRNAME = ".pace_view_cache"
+
+
+def atomic_write(path, write):
+    """
+    Write through a temporary file and rename it into place.
+    ``write`` is called with the temporary path.
+    """
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        write(tmp_path)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def to_day(value):
+    """
+    A date-like value as a ``datetime64[D]`` day.
+    """
+    return np.datetime64(pd.Timestamp(value).to_datetime64(), "D")
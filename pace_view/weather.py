@@ -0,0 +1,314 @@
+"""
+Weather providers and a persistent cache of hourly samples keyed by location tile.
+"""
+
+import csv
+import http.client
+import json
+import os
+import threading
+import time
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pandas as pd
+from .utils import CACHE_DIRNAME, atomic_write
+
+WEATHER_FIELDS = ("temp", "wspd", "wdir", "hum")
+TILE_DEGREES = 0.1
+WEATHER_CACHE_FILENAME = "weather.json"
+
+
+def _to_hour(value):
+    return pd.Timestamp(value).floor("h")
+
+
+def weather_key(lat, lon, hour, tile_degrees=TILE_DEGREES):
+    """
+    Cache key of a weather sample: the tile centre (lat/lon rounded to ``tile_degrees``) and the hour.
+    Returns (key, tile_lat, tile_lon, hour).
+    """
+    tile_lat = round(round(float(lat) / tile_degrees) * tile_degrees, 6)
+    tile_lon = round(round(float(lon) / tile_degrees) * tile_degrees, 6)
+    hour = _to_hour(hour)
+    return f"{tile_lat:.4f},{tile_lon:.4f},{hour:%Y-%m-%dT%H}", tile_lat, tile_lon, hour
+
+
+class VisualCrossingProvider:
+    """
+    Hourly weather from the VisualCrossing history API (one request per sample).
+    """
+    url = "/VisualCrossingWebServices/rest/services/weatherdata/history?"
+
+    def __init__(self, api_key, unit_group="metric", host="weather.visualcrossing.com", https=True, timeout=30):
+        self.api_key = api_key
+        self.unit_group = unit_group
+        self.host = host
+        self.https = https
+        self.timeout = timeout
+
+    def request_path(self, lat, lon, hour):
+        """
+        Request path for the sample at (lat, lon) and ``hour``.
+        """
+        time_start = _to_hour(hour).strftime("%Y-%m-%dT%H:%M:%S")
+        params = {
+            "aggregateHours": 1,
+            "combinationMethod": "aggregate",
+            "startDateTime": time_start,
+            "endDateTime": time_start,
+            "maxStations": -1,
+            "maxDistance": -1,
+            "contentType": "json",
+            "unitGroup": self.unit_group,
+            "locationMode": "single",
+            "key": self.api_key,
+            "dataElements": "all",
+            "locations": f"{lat:.5f}, {lon:.5f}",
+        }
+        return self.url + urllib.parse.urlencode(params)
+
+    def fetch(self, lat, lon, hour):
+        """
+        Return {temp, wspd, wdir, hum} for (lat, lon) at ``hour``.
+        """
+        connection_cls = http.client.HTTPSConnection if self.https else http.client.HTTPConnection
+        connection = connection_cls(self.host, timeout=self.timeout)
+        try:
+            connection.request("GET", self.request_path(lat, lon, hour))
+            response = connection.getresponse()
+            body = response.read().decode("utf-8")
+            if response.status != 200:
+                raise Exception(f"Weather API returned {response.status}: {body[:200]}")
+        finally:
+            connection.close()
+
+        values = json.loads(body)["location"]["values"][0]
+        return {
+            "temp": values.get("temp"),
+            "wspd": values.get("wspd"),
+            "wdir": values.get("wdir"),
+            "hum": values.get("humidity"),
+        }
+
+
+class LocalWeatherProvider:
+    """
+    File-backed stand-in provider for offline and test runs.
+
+    Reads a CSV with ``time``, ``temp``, ``wspd``, ``wdir``, ``hum`` and optional
+    ``lat``/``lon`` columns. A request returns the row nearest in time among the
+    rows of the same tile, or among all rows when the tile has none.
+    """
+    def __init__(self, path, tile_degrees=TILE_DEGREES):
+        self.path = path
+        self.tile_degrees = tile_degrees
+        with open(path, newline="", encoding="utf-8") as handle:
+            rows = list(csv.DictReader(handle))
+        if not rows:
+            raise ValueError(f"No weather rows in {path}")
+
+        self.times = pd.to_datetime([row["time"] for row in rows]).to_numpy(dtype="datetime64[s]")
+        self.values = np.array([[float(row[name]) for name in WEATHER_FIELDS] for row in rows])
+        self.tiles = [
+            weather_key(row["lat"], row["lon"], 0, tile_degrees)[1:3] if row.get("lat") and row.get("lon") else None
+            for row in rows
+        ]
+
+    def fetch(self, lat, lon, hour):
+        """
+        Return {temp, wspd, wdir, hum} for (lat, lon) at ``hour``.
+        """
+        tile = weather_key(lat, lon, hour, self.tile_degrees)[1:3]
+        candidates = np.array([t == tile for t in self.tiles])
+        if not candidates.any():
+            candidates[:] = True
+
+        target = _to_hour(hour).to_datetime64().astype("datetime64[s]")
+        distance = np.abs((self.times - target).astype(np.int64)).astype(float)
+        distance[~candidates] = np.inf
+        row = self.values[int(np.argmin(distance))]
+        return dict(zip(WEATHER_FIELDS, row.tolist()))
+
+
+class WeatherCache:
+    """
+    Hourly weather samples keyed by `weather_key`, kept in memory and persisted as JSON.
+
+    Without a ``path`` the cache only lives for the session.
+    """
+    def __init__(self, path=None):
+        self.path = path
+        self._entries = None
+        self._dirty = False
+
+    @classmethod
+    def for_folder(cls, folder):
+        """
+        Create a cache stored next to the activity cache of the given folder.
+        """
+        return cls(os.path.join(folder, CACHE_DIRNAME, WEATHER_CACHE_FILENAME))
+
+    @property
+    def entries(self):
+        if self._entries is None:
+            self._entries = {}
+            if self.path and os.path.exists(self.path):
+                try:
+                    with open(self.path, encoding="utf-8") as handle:
+                        self._entries = json.load(handle)
+                except (OSError, ValueError):
+                    self._entries = {}
+        return self._entries
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def get(self, key):
+        return self.entries.get(key)
+
+    def put(self, key, sample):
+        self.entries[key] = {name: sample.get(name) for name in WEATHER_FIELDS}
+        self._dirty = True
+
+    def save(self):
+        """
+        Write pending samples to disk (no-op for in-memory caches or when nothing changed).
+        """
+        if not self.path or not self._dirty:
+            return
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+
+        def write(tmp_path):
+            with open(tmp_path, "w", encoding="utf-8") as handle:
+                json.dump(self.entries, handle)
+
+        atomic_write(self.path, write)
+        self._dirty = False
+
+
+class CachedWeatherProvider:
+    """
+    Serves samples from a `WeatherCache` and asks the wrapped provider only on a miss.
+
+    Requests are snapped to the tile centre and the hour, so nearby points within
+    the same hour share one sample and each (tile, hour) is fetched once.
+    """
+    def __init__(self, provider, cache=None, tile_degrees=TILE_DEGREES):
+        self.provider = provider
+        self.cache = cache if cache is not None else WeatherCache()
+        self.tile_degrees = tile_degrees
+
+    def fetch(self, lat, lon, hour):
+        key, tile_lat, tile_lon, hour = weather_key(lat, lon, hour, self.tile_degrees)
+        sample = self.cache.get(key)
+        if sample is None:
+            sample = self.provider.fetch(tile_lat, tile_lon, hour.to_pydatetime())
+            self.cache.put(key, sample)
+        return sample
+
+    def save(self):
+        self.cache.save()
+
+
+def hourly_points(positions, timestamps):
+    """
+    Hours spanning a ride (its first hour through the hour after its end), each paired
+    with the position recorded nearest to it. Returns (hours, lats, lons); empty when
+    the ride has no timestamps or positions.
+    """
+    timestamps = np.asarray(timestamps, dtype="datetime64[s]")
+    positions = np.asarray(positions, dtype=float).reshape(-1, 2)
+    valid = ~np.isnat(timestamps) & np.isfinite(positions).all(axis=1)
+    timestamps, positions = timestamps[valid], positions[valid]
+    if len(timestamps) == 0:
+        empty = np.empty(0)
+        return np.empty(0, dtype="datetime64[h]"), empty, empty
+
+    first = timestamps.min().astype("datetime64[h]")
+    last = timestamps.max().astype("datetime64[h]") + np.timedelta64(1, "h")
+    hours = np.arange(first, last + np.timedelta64(1, "h"))
+
+    order = np.argsort(timestamps, kind="stable")
+    times = timestamps[order]
+    targets = hours.astype("datetime64[s]")
+    right = np.clip(np.searchsorted(times, targets), 0, len(times) - 1)
+    left = np.clip(right - 1, 0, len(times) - 1)
+    nearest = np.where(np.abs(times[left] - targets) <= np.abs(times[right] - targets), left, right)
+    picked = positions[order][nearest]
+    return hours, picked[:, 0], picked[:, 1]
+
+
+class RateLimiter:
+    """
+    Spaces request starts at least ``1 / rate`` seconds apart across threads (no limit when rate is None).
+    """
+    def __init__(self, rate=None):
+        self.interval = 1.0 / rate if rate else 0.0
+        self._lock = threading.Lock()
+        self._next = 0.0
+
+    def wait(self):
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next)
+            self._next = start + self.interval
+        if start > now:
+            time.sleep(start - now)
+
+
+def _fetch_with_retry(provider, limiter, lat, lon, hour, retries, backoff, max_backoff):
+    for attempt in range(retries + 1):
+        limiter.wait()
+        try:
+            return provider.fetch(lat, lon, hour)
+        except Exception:
+            if attempt == retries:
+                raise
+            time.sleep(min(backoff * 2 ** attempt, max_backoff))
+
+
+def prefetch(cached, rides, max_workers=8, rate_limit=None, retries=3, backoff=0.5, max_backoff=30.0):
+    """
+    Fill a `CachedWeatherProvider`'s cache with the hourly samples of many rides at once.
+
+    ``rides`` yields (positions, timestamps) pairs. The (tile, hour) keys of all rides
+    are collected and deduplicated first, keys already cached are skipped, and the
+    rest are fetched from the wrapped provider by up to ``max_workers`` threads,
+    at most ``rate_limit`` requests per second, retrying failures with exponential
+    backoff. Keys that still fail are left out (parsing fetches them on demand).
+    Returns counts of needed, cached, fetched, and failed keys.
+    """
+    needed = {}
+    for positions, timestamps in rides:
+        hours, lats, lons = hourly_points(positions, timestamps)
+        for hour, lat, lon in zip(hours, lats, lons):
+            key, tile_lat, tile_lon, hour = weather_key(lat, lon, pd.Timestamp(hour), cached.tile_degrees)
+            needed.setdefault(key, (tile_lat, tile_lon, hour.to_pydatetime()))
+
+    missing = {key: point for key, point in needed.items() if key not in cached.cache}
+    stats = {"needed": len(needed), "cached": len(needed) - len(missing), "fetched": 0, "failed": 0}
+    if not missing:
+        return stats
+
+    limiter = RateLimiter(rate_limit)
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(missing)))) as pool:
+        futures = {
+            key: pool.submit(_fetch_with_retry, cached.provider, limiter, *point, retries, backoff, max_backoff)
+            for key, point in missing.items()
+        }
+        for key, future in futures.items():
+            try:
+                cached.cache.put(key, future.result())
+                stats["fetched"] += 1
+            except Exception as e:
+                print(f"Weather prefetch failed for {key}: {e}")
+                stats["failed"] += 1
+
+    cached.save()
+    return stats
@@ -0,0 +1,113 @@
+"""
+Prefix-sum index of daily time in HR zones for fast period queries.
+"""
+
+import numpy as np
+import pandas as pd
+from .utils import to_day
+
+ZONE_COLUMNS = [f"z{i}_sec" for i in range(1, 6)]
+
+
+class ZoneIndex:
+    """
+    Cumulative zone seconds per day, built once per data load.
+
+    Any date-range or trailing-period zone mix is the difference of two
+    cumulative rows found by binary search, so queries cost O(log n) in the
+    number of days. Adding a ride for the latest day (or a new one after it)
+    is amortized O(1); back-dated rides shift the later rows.
+    """
+    def __init__(self, capacity=64):
+        capacity = max(1, int(capacity))
+        self._days = np.empty(capacity, dtype="datetime64[D]")
+        # Row k holds the totals of the first k days, so row 0 is all zeros.
+        self._cumulative = np.zeros((capacity + 1, len(ZONE_COLUMNS)))
+        self._size = 0
+
+    @classmethod
+    def from_summary(cls, total_summary):
+        """
+        Build the index from a summary dataframe with ``date`` and zone-second columns.
+        """
+        index = cls(capacity=len(total_summary))
+        if total_summary.empty:
+            return index
+
+        daily = (
+            total_summary.assign(date=pd.to_datetime(total_summary["date"]).dt.floor("D"))
+            .groupby("date")[ZONE_COLUMNS]
+            .sum()
+        )
+        size = len(daily)
+        index._days[:size] = daily.index.to_numpy().astype("datetime64[D]")
+        index._cumulative[1:size + 1] = np.cumsum(daily.to_numpy(dtype=float), axis=0)
+        index._size = size
+        return index
+
+    def __len__(self):
+        return self._size
+
+    @property
+    def days(self):
+        """
+        Indexed days in ascending order.
+        """
+        return self._days[:self._size]
+
+    def _grow(self):
+        capacity = 2 * len(self._days)
+        days = np.empty(capacity, dtype="datetime64[D]")
+        days[:self._size] = self._days[:self._size]
+        cumulative = np.zeros((capacity + 1, len(ZONE_COLUMNS)))
+        cumulative[:self._size + 1] = self._cumulative[:self._size + 1]
+        self._days, self._cumulative = days, cumulative
+
+    def add(self, date, zone_seconds):
+        """
+        Add one activity's zone seconds (mapping with z1_sec..z5_sec or a 5-value sequence).
+        """
+        if hasattr(zone_seconds, "keys"):
+            values = np.array([zone_seconds.get(c, 0.0) for c in ZONE_COLUMNS], dtype=float)
+        else:
+            values = np.asarray(zone_seconds, dtype=float)
+        values = np.nan_to_num(values)
+
+        day = to_day(date)
+        size = self._size
+        pos = int(np.searchsorted(self._days[:size], day, side="left"))
+
+        if pos == size or self._days[pos] != day:
+            if size == len(self._days):
+                self._grow()
+            # Open a slot for the new day; rows after it are shifted by one.
+            self._days[pos + 1:size + 1] = self._days[pos:size]
+            self._cumulative[pos + 2:size + 2] = self._cumulative[pos + 1:size + 1]
+            self._days[pos] = day
+            self._cumulative[pos + 1] = self._cumulative[pos]
+            self._size = size = size + 1
+
+        self._cumulative[pos + 1:size + 1] += values
+
+    def totals(self, start=None, end=None):
+        """
+        Zone seconds summed over days in [start, end] (either bound may be open).
+        """
+        days = self.days
+        lo = int(np.searchsorted(days, to_day(pd.Timestamp(start).ceil("D")), side="left")) if start is not None else 0
+        hi = int(np.searchsorted(days, to_day(end), side="right")) if end is not None else self._size
+        if hi <= lo:
+            return np.zeros(len(ZONE_COLUMNS))
+        return self._cumulative[hi] - self._cumulative[lo]
+
+    def zone_mix(self, period, end=None):
+        """
+        Zone seconds over the trailing ``period`` (e.g. "7D") ending at ``end`` (default: the latest day),
+        in the (category, value) layout of `DataCleaner.hr_zones_summary`.
+        """
+        if self._size == 0:
+            values = np.zeros(len(ZONE_COLUMNS))
+        else:
+            end = pd.Timestamp(self._days[self._size - 1]) if end is None else pd.Timestamp(end)
+            values = self.totals(start=end - pd.to_timedelta(period), end=end)
+        return pd.DataFrame({"category": ZONE_COLUMNS, "value": values})
@@ -1,12 +1,39 @@
+import numpy as np
 import pandas as pd
+import plotly.graph_objects as go
 import pytest
+from niaarm.feature import Feature
+from niaarm.rule import Rule
+from tcxreader.tcxreader import TCXReader
 
-from pace_view.data_parsing import DataParser
-from pace_view.data_cleaning import DataCleaner
-from pace_view.physics import PhysicsEngine
+from pace_view.data_parsing import DataParser, WeatherSeries, interpolate_weather, read_tcx, read_tcx_track
+from pace_view.data_cleaning import DataCleaner, rolling_linear_trend
+from pace_view.physics import PhysicsEngine, StreamingPhysics
 from pace_view.core import ContextTrainer
+from pace_view.history_store import HistoryStore
+from pace_view.activity_cache import ActivityCache
+from pace_view.counterfactual import CounterfactualAnalyzer
+from pace_view.digital_twin import BACKENDS, DigitalTwinModel
+from pace_view.figure_cache import FigureCache, data_version
+from pace_view.mining import PatternMiner, _weighted_rule_metrics
+from pace_view.tcx_sources import list_tcx_sources, source_exists, source_name
+from pace_view.training_load import TrainingLoadModel
+from pace_view.weather import LocalWeatherProvider, VisualCrossingProvider, WeatherCache, weather_key
+from pace_view.zone_index import ZONE_COLUMNS, ZoneIndex
 
+import bz2
+import gzip
+import json
 import os
+import re
+import shutil
+import threading
+import tracemalloc
+import urllib.parse
+import zipfile
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
 
 # DO NOT CHANGE TEST DATASET - SOME ASSERTS IN TESTS RELY ON THAT
 
@@ -79,9 +106,9 @@ def test_mining_with_fifty_tcx_files(monkeypatch):
 
     trainer.fit()
 
-    cache_path = "tests/data/history_cache.csv"
-    df_history = pd.read_csv(cache_path)
+    df_history = HistoryStore.for_folder("tests/data/").read(columns=["drift"])
     assert "drift" in df_history.columns
+    assert len(df_history) > 0
 
     _ = trainer.mine_patterns() or {}
     activity_report = trainer.explain(TARGET_FILE) or {}
@@ -93,3 +120,757 @@ def test_mining_with_fifty_tcx_files(monkeypatch):
     assert "Rationales" in activity_report
     assert "Atmosphere" in activity_report["Rationales"]
     assert "COOLING EFFECT" in activity_report["Rationales"]["Atmosphere"]
+
+
+#parallel history ingestion must match the serial order and content
+def test_parallel_history_ingestion_matches_serial():
+    paths = [os.path.join("tests/data", f) for f in sorted(os.listdir("tests/data")) if f.endswith(".tcx")]
+
+    serial = ContextTrainer(history_folder="tests/data/")._load_history(paths)
+    parallel = ContextTrainer(history_folder="tests/data/", n_workers=2, chunk_size=2)._load_history(paths)
+
+    assert len(serial) == len(parallel) > 0
+    for (path_serial, df_serial), (path_parallel, df_parallel) in zip(serial, parallel):
+        assert path_serial == path_parallel
+        pd.testing.assert_frame_equal(df_serial, df_parallel)
+
+    # The batch physics pass over all rides matches the per-ride physics
+    per_ride = ContextTrainer(history_folder="tests/data/")._process_file(serial[0][0], is_training=True)
+    for col in PhysicsEngine.batch_outputs:
+        pd.testing.assert_series_equal(serial[0][1][col], per_ride[col], rtol=1e-9)
+
+
+#single-pass tcx reader feeds both the model pipeline and the dashboard summaries
+def test_single_pass_tcx_reader():
+    parser = DataParser(weather_api_key=None)
+    exercise = parser.parse_tcx_file("tests/data/1.tcx")
+
+    assert exercise.activity_type == "Biking"
+    assert exercise.calories == 374
+    assert exercise.distance == pytest.approx(8869.41)
+    assert len(exercise.timestamps) == len(exercise.heartrates) == len(exercise.latitudes)
+
+    activity = exercise.to_activity()
+    parsed_activity, _ = parser.parse_file("tests/data/1.tcx", is_training=True)
+    assert len(activity["timestamps"]) == len(parsed_activity["timestamps"])
+    assert activity["speeds"][0] == 0
+
+
+#cached activities are reused and invalidated when the source file changes
+def test_activity_cache_invalidation(tmp_path):
+    tcx_path = tmp_path / "ride.tcx"
+    tcx_path.write_bytes(open("tests/data/12.tcx", "rb").read())
+    cache = ActivityCache(str(tmp_path / "cache"))
+    parser = DataParser(weather_api_key=None, cache=cache)
+
+    first = parser.read_activity(str(tcx_path))
+    assert cache.load_activity(str(tcx_path)) is not None
+    key = cache.content_key(str(tcx_path))
+
+    edited = open("tests/data/12.tcx", encoding="utf-8").read().replace("<Calories>", "<Calories>1", 1)
+    tcx_path.write_text(edited, encoding="utf-8")
+    os.utime(tcx_path, ns=(0, 0))
+
+    assert cache.content_key(str(tcx_path)) != key
+    assert cache.load_activity(str(tcx_path)) is None
+    second = parser.read_activity(str(tcx_path))
+    assert second.calories == first.calories + 1000
+    assert len(second) == len(first)
+
+
+#history store appends partitions and reads back only the requested columns
+def test_history_store_append_and_column_reads(tmp_path):
+    store = HistoryStore(str(tmp_path / "store"))
+    first = pd.DataFrame({"headwind_mps": [1.0, 2.0], "grad": [0.0, 0.1], "drift": [3.0, -1.0], "hr": [120, 130]})
+    second = pd.DataFrame({"headwind_mps": [0.5], "grad": [0.02], "drift": [7.0], "hr": [150]})
+
+    store.append("a.tcx", first)
+    store.append("b.tcx", second)
+
+    assert store.activity_ids() == ["a.tcx", "b.tcx"]
+    df = store.read(columns=["grad", "drift"])
+    assert list(df.columns) == ["grad", "drift"]
+    assert df["drift"].tolist() == [3.0, -1.0, 7.0]
+    assert store.read(activity_ids=["b.tcx"])["hr"].dtype == second["hr"].dtype
+
+    # A batch replaces and adds partitions with a single manifest write
+    saves = []
+    save_manifest = store._save_manifest
+    store._save_manifest = lambda manifest: (saves.append(1), save_manifest(manifest))
+    store.extend([("a.tcx", second), ("c.tcx", first), ("d.tcx", second)])
+    assert len(saves) == 1
+    assert store.activity_ids() == ["b.tcx", "a.tcx", "c.tcx", "d.tcx"]
+    assert store.read(columns=["drift"], activity_ids=["a.tcx"])["drift"].tolist() == [7.0]
+
+
+#a second fit over unchanged history reloads the saved model instead of retraining
+def test_fit_reuses_saved_model(tmp_path, monkeypatch):
+    for name in ["1.tcx", "12.tcx", "10.tcx"]:
+        (tmp_path / name).write_bytes(open(os.path.join("tests/data", name), "rb").read())
+
+    ContextTrainer(history_folder=str(tmp_path)).fit()
+    assert os.path.exists(tmp_path / "digital_twin.joblib")
+
+    trainer = ContextTrainer(history_folder=str(tmp_path))
+    monkeypatch.setattr(trainer.model, "train", lambda df: pytest.fail("model was retrained"))
+    trainer.fit()
+    assert trainer.model.is_trained
+    assert len(trainer.model.predict(HistoryStore.for_folder(str(tmp_path)).read().head(5))) == 5
+
+
+#updating with a new ride appends its partition and grows the forest instead of retraining
+def test_incremental_update(tmp_path, monkeypatch):
+    for name in ["1.tcx", "12.tcx"]:
+        (tmp_path / name).write_bytes(open(os.path.join("tests/data", name), "rb").read())
+
+    trainer = ContextTrainer(history_folder=str(tmp_path))
+    trainer.fit()
+    store = HistoryStore.for_folder(str(tmp_path))
+    old_drift = store.read(columns=["drift"], activity_ids=["1.tcx"])
+    n_trees = trainer.model.model.n_estimators
+
+    (tmp_path / "19.tcx").write_bytes(open("tests/data/19.tcx", "rb").read())
+    monkeypatch.setattr(trainer.model, "train", lambda df: pytest.fail("model was retrained"))
+    trainer.update(["19.tcx"], n_new_trees=5)
+
+    assert trainer.model.model.n_estimators == n_trees + 5
+    assert store.activity_ids() == ["1.tcx", "12.tcx", "19.tcx"]
+    pd.testing.assert_frame_equal(store.read(columns=["drift"], activity_ids=["1.tcx"]), old_drift)
+
+    reloaded = ContextTrainer(history_folder=str(tmp_path))
+    monkeypatch.setattr(reloaded.model, "train", lambda df: pytest.fail("model was retrained"))
+    reloaded.fit()
+    assert reloaded.model.model.n_estimators == n_trees + 5
+
+
+#every digital twin backend trains and predicts on the same features
+def test_digital_twin_backends():
+    parser = DataParser(weather_api_key=None)
+    act, weather = parser.parse_file("tests/data/12.tcx", is_training=True)
+    df = PhysicsEngine().calculate_virtual_power(DataCleaner(parser).to_dataframe(act, weather))
+
+    for backend in BACKENDS:
+        model = DigitalTwinModel(backend=backend)
+        model.train(df)
+        assert len(model.predict(df)) == len(df)
+        assert model.supports_update == (backend in ("random_forest", "hist_gradient_boosting"))
+
+    boosted = DigitalTwinModel(backend="hist_gradient_boosting")
+    boosted.train(df)
+    boosted.update(df, n_new_trees=5)
+    assert boosted.model.max_iter == 205
+
+
+#counterfactual scenarios are scored in one batched predict
+def test_counterfactual_scenario_sweep(monkeypatch):
+    parser = DataParser(weather_api_key=None)
+    act, weather = parser.parse_file("tests/data/12.tcx", is_training=True)
+    df = PhysicsEngine().calculate_virtual_power(DataCleaner(parser).to_dataframe(act, weather))
+    model = DigitalTwinModel(backend="linear")
+    model.train(df)
+    analyzer = CounterfactualAnalyzer(model)
+
+    calls = []
+    predict = model.model.predict
+    monkeypatch.setattr(model.model, "predict", lambda X: calls.append(len(X)) or predict(X))
+    penalties = analyzer.sweep(df, CounterfactualAnalyzer.grid("temp", [10, 20, 30]))
+
+    assert calls == [4 * len(df)]
+    assert list(penalties.columns) == ["temp=10", "temp=20", "temp=30"]
+    assert penalties["temp=20"].abs().max() < 1e-9
+
+    analyzed = analyzer.analyze(df)
+    expected = analyzer.sweep(df, [analyzer.standard_env]).iloc[:, 0]
+    assert (analyzed["env_penalty_bpm"] - expected).abs().max() < 1e-9
+
+
+#pattern mining runs in memory without writing temp files to the working directory
+def test_mining_is_in_memory(tmp_path, monkeypatch):
+    rng = np.random.default_rng(0)
+    history = pd.DataFrame({
+        "headwind_mps": rng.normal(0, 3, 500),
+        "grad": rng.normal(0, 0.03, 500),
+        "drift": rng.normal(0, 6, 500),
+    })
+    monkeypatch.chdir(tmp_path)
+
+    report = PatternMiner().discover_rules(history)
+
+    assert "Top_Rules" in report
+    assert list(tmp_path.iterdir()) == []
+
+
+#weighted unique transactions give the same rule metrics as the per-row table
+def test_weighted_transactions_match_rows():
+    rng = np.random.default_rng(1)
+    history = pd.DataFrame({
+        "headwind_mps": rng.normal(0, 3, 5000),
+        "grad": rng.normal(0.01, 0.03, 5000),
+        "drift": rng.normal(0, 6, 5000),
+    })
+    miner = PatternMiner()
+    discrete = miner._discretize(history)
+    transactions, weights = miner._weighted_transactions(discrete)
+
+    assert len(transactions) <= 18
+    assert weights.sum() == len(discrete)
+
+    antecedent = [Feature("Wind", "cat", categories=["Headwind"]), Feature("Terrain", "cat", categories=["Climb"])]
+    consequent = [Feature("Status", "cat", categories=["Struggling"])]
+    rows = Rule(antecedent, consequent, transactions=discrete.astype(str).reset_index(drop=True))
+    weighted = _weighted_rule_metrics(antecedent, consequent, transactions, weights)
+    for metric in ("support", "confidence", "lift"):
+        assert weighted[metric] == pytest.approx(getattr(rows, metric))
+
+
+#exact mining enumerates every antecedent deterministically and falls back to NiaARM on large spaces
+def test_exact_rule_miner(monkeypatch):
+    rng = np.random.default_rng(2)
+    history = pd.DataFrame({
+        "headwind_mps": rng.normal(0, 3, 3000),
+        "grad": rng.normal(0.01, 0.03, 3000),
+        "drift": rng.normal(0, 6, 3000),
+    })
+    miner = PatternMiner(method="exact")
+    transactions, weights = miner._weighted_transactions(miner._discretize(history))
+    assert miner._antecedent_space_size(transactions) == 11
+
+    rules = miner._mine_exact(transactions, weights)
+    assert rules == miner._mine_exact(transactions, weights)
+
+    discrete = miner._discretize(history).astype(str)
+    headwind = next(r for r in rules if r["rule"] == "[Wind(Headwind)] => [Status(Struggling)]")
+    mask = discrete["Wind"] == "Headwind"
+    struggling = discrete["Status"] == "Struggling"
+    assert headwind["support"] == pytest.approx((mask & struggling).mean())
+    assert headwind["confidence"] == pytest.approx(struggling[mask].mean())
+    assert headwind["lift"] == pytest.approx(struggling[mask].mean() / struggling.mean())
+
+    report = miner.discover_rules(history)
+    assert report["Top_Rules"] == [r["rule"] for r in rules[:10]]
+
+    fallback = PatternMiner(max_exact_antecedents=0)
+    monkeypatch.setattr(fallback, "_mine_exact", lambda *args: pytest.fail("exact miner used"))
+    found = fallback.discover_rules(history)["Rule_Metrics"]
+    assert found and all("Status(Struggling)" in rule["rule"].split("=>")[1] for rule in found)
+    exact = {r["rule"]: r for r in rules}
+    for rule in found:
+        if rule["rule"] in exact:
+            assert rule["support"] == pytest.approx(exact[rule["rule"]]["support"])
+            assert rule["confidence"] == pytest.approx(exact[rule["rule"]]["confidence"])
+
+
+#columnar timeframes for tcxreader exercises match the per-trackpoint construction
+def test_exercise_timeframes_columnar_matches_rows():
+    exercise = TCXReader().read("tests/data/1.tcx")
+    exercise.trackpoints[3].hr_value = None
+    exercise.trackpoints[5].time = None
+
+    cleaner = DataCleaner()
+    rows = pd.DataFrame([
+        {
+            "time": pd.to_datetime(tp.time, utc=True, errors="coerce"),
+            "h_r": tp.hr_value,
+            "dist_m": tp.distance,
+            "alt_m": tp.elevation,
+            "lat": tp.latitude,
+            "lon": tp.longitude,
+        }
+        for tp in exercise.trackpoints
+    ])
+
+    pd.testing.assert_frame_equal(cleaner.exercise_timeframes(exercise), cleaner._finalize_timeframes(rows))
+
+
+#prefix-sum rolling trend matches a per-window polyfit, including tied dates
+def test_rolling_linear_trend_matches_polyfit():
+    rng = np.random.default_rng(3)
+    x = np.sort(rng.integers(0, 400, 200))
+    y = rng.normal(0.3, 0.05, 200)
+
+    expected = []
+    for xi in x:
+        window = (x >= xi - 30) & (x <= xi)
+        if window.sum() < 2:
+            expected.append(np.nan)
+        elif np.ptp(x[window]) == 0:
+            expected.append(y[window].mean())
+        else:
+            slope, intercept = np.polyfit(x[window], y[window], 1)
+            expected.append(slope * xi + intercept)
+
+    np.testing.assert_allclose(rolling_linear_trend(x, y, 30), expected, rtol=1e-9, atol=1e-12)
+
+    cleaner = DataCleaner()
+    dates = pd.Series(pd.Timestamp("2024-01-01") + pd.to_timedelta(x, unit="D"))
+    trend = cleaner.efficiency_trend(dates, y, 30)
+    np.testing.assert_allclose(trend, expected, rtol=1e-9, atol=1e-12)
+    assert cleaner.efficiency_trend(dates, y, 30) is trend
+
+
+#figures can be built one at a time and are memoized per data version, figure, and period
+def test_figure_cache_builds_each_key_once():
+    parser = DataParser(weather_api_key=None)
+    cleaner = DataCleaner()
+    summary = cleaner.build_dashboard(parser.parse_tcx_directory("tests/data/"))
+
+    themed = []
+    cache = FigureCache(theme=lambda fig: themed.append(fig) or fig)
+    version = data_version(summary)
+
+    first = cache.get(version, "zone_mix", "7D", lambda: cleaner.zone_mix_figure(summary, "7D"))
+    again = cache.get(version, "zone_mix", "7D", lambda: pytest.fail("figure rebuilt"))
+    other = cache.get(version, "zone_mix", "30D", lambda: cleaner.zone_mix_figure(summary, "30D"))
+
+    assert first is again
+    assert len(themed) == 2
+    assert go.Figure(first).to_json() == go.Figure(cleaner.return_figures(summary, "7D")[0]).to_json()
+    assert go.Figure(other).to_json() == go.Figure(cleaner.zone_mix_figure(summary, "30D")).to_json()
+
+    changed = summary.copy()
+    changed.loc[changed.index[0], "avg_h_r"] += 1
+    assert data_version(changed) != version
+    assert data_version(summary.copy()) == version
+
+
+#zone index answers period queries like hr_zones_summary, also when built incrementally out of order
+def test_zone_index_matches_hr_zones_summary():
+    rng = np.random.default_rng(4)
+    dates = pd.Timestamp("2023-01-01") + pd.to_timedelta(rng.integers(0, 500, 300), unit="D")
+    summary = pd.DataFrame({"date": dates.date})
+    for col in ZONE_COLUMNS:
+        summary[col] = rng.integers(0, 3600, 300).astype(float)
+
+    cleaner = DataCleaner()
+    built = ZoneIndex.from_summary(summary)
+    incremental = ZoneIndex(capacity=1)
+    for _, row in summary.iterrows():
+        incremental.add(row["date"], row)
+
+    for period in ("7D", "30D", "365D"):
+        expected = cleaner.hr_zones_summary(summary, period)
+        pd.testing.assert_frame_equal(cleaner.hr_zones_summary(summary, period, zone_index=built), expected)
+        pd.testing.assert_frame_equal(incremental.zone_mix(period), expected)
+
+    in_range = summary[(pd.to_datetime(summary["date"]) >= "2023-03-01") & (pd.to_datetime(summary["date"]) <= "2023-05-31")]
+    np.testing.assert_allclose(built.totals("2023-03-01", "2023-05-31"), in_range[ZONE_COLUMNS].sum().to_numpy())
+
+
+#training load series match the batch EWMA and update incrementally per ride
+def test_training_load_model(tmp_path):
+    rng = np.random.default_rng(5)
+    dates = pd.Timestamp("2023-01-01") + pd.to_timedelta(rng.integers(0, 200, 80), unit="D")
+    summary = pd.DataFrame({"date": dates.date, "trimp_bannister": rng.uniform(20, 200, 80)})
+
+    cleaner = DataCleaner()
+    daily = summary.groupby(pd.to_datetime(summary["date"]))["trimp_bannister"].sum().asfreq("D", fill_value=0)
+    model = TrainingLoadModel.from_summary(summary)
+    series = model.series()
+
+    np.testing.assert_array_equal(series["ctl"].to_numpy(), cleaner.ewma_series(daily, 42).to_numpy())
+    np.testing.assert_array_equal(series["atl"].to_numpy(), cleaner.ewma_series(daily, 7).to_numpy())
+    np.testing.assert_array_equal(series["tsb"].to_numpy(), (series["ctl"] - series["atl"]).to_numpy())
+
+    incremental = TrainingLoadModel(capacity=1)
+    for _, row in summary.iterrows():
+        incremental.add(row["date"], row["trimp_bannister"])
+    pd.testing.assert_frame_equal(incremental.series(), series, rtol=1e-12)
+
+    window = model.series("2023-03-01", "2023-03-10")
+    assert len(window) == 10
+    pd.testing.assert_frame_equal(window, series.loc["2023-03-01":"2023-03-10"])
+
+    model.save(tmp_path / "load.npz")
+    pd.testing.assert_frame_equal(TrainingLoadModel.load(tmp_path / "load.npz").series(), series)
+
+    # The cleaner builds its model from the dashboard summary only when first asked for it
+    assert cleaner.load_model is None
+    cleaner._dashboard_frame(summary.assign(avg_speed_mps=8.0, duration_s=3600.0))
+    assert cleaner._load_model is None
+    pd.testing.assert_frame_equal(cleaner.load_model.series(), series)
+    assert cleaner.load_model is cleaner.load_model
+
+
+#the load model persists next to the activity cache and only new rides are added to it
+def test_training_load_model_persists(tmp_path, monkeypatch):
+    files = sorted(os.path.join("tests/data", f) for f in os.listdir("tests/data") if f.endswith(".tcx"))
+    cache = ActivityCache(str(tmp_path / "cache"))
+    first = DataCleaner(DataParser(cache=cache))
+    first.build_dashboard_from_files(files[:6])
+    assert len(first.load_model.rides) > 0
+    assert os.path.exists(os.path.join(cache.cache_dir, "training_load.npz"))
+
+    # More rides extend the stored series; no rebuild from the whole summary
+    cleaner = DataCleaner(DataParser(cache=cache))
+    summary = cleaner.build_dashboard_from_files(files)
+    expected = TrainingLoadModel.from_summary(summary)
+    monkeypatch.setattr(TrainingLoadModel, "from_summary", lambda *args, **kwargs: pytest.fail("rebuilt"))
+    pd.testing.assert_frame_equal(cleaner.load_model.series(), expected.series(), rtol=1e-12)
+    assert cleaner.load_model.rides == expected.rides
+    assert TrainingLoadModel.load(os.path.join(cache.cache_dir, "training_load.npz")).rides == expected.rides
+
+    # Removing rides rebuilds the model
+    monkeypatch.undo()
+    fewer = DataCleaner(DataParser(cache=cache))
+    fewer.build_dashboard_from_files(files[:6])
+    assert fewer.load_model.rides == first.load_model.rides
+
+
+#compact schema keeps the values in float32/epoch seconds and drops physics scratch columns
+def test_compact_history_schema(tmp_path):
+    for name in ["1.tcx", "12.tcx"]:
+        (tmp_path / name).write_bytes(open(os.path.join("tests/data", name), "rb").read())
+
+    full = ContextTrainer(history_folder=str(tmp_path), use_cache=False)._process_file(str(tmp_path / "1.tcx"))
+    trainer = ContextTrainer(history_folder=str(tmp_path), use_cache=False, compact=True, backend="linear")
+    compact = trainer._process_file(str(tmp_path / "1.tcx"))
+
+    assert not set(PhysicsEngine.scratch_columns) & set(compact.columns)
+    assert compact["time"].dtype == np.int64
+    assert all(compact[c].dtype == np.float32 for c in compact.columns if c != "time")
+    assert (compact["time"].to_numpy() == full["time"].to_numpy().astype("datetime64[s]").astype(np.int64)).all()
+    np.testing.assert_allclose(compact["virtual_power"], full["virtual_power"], rtol=1e-6, atol=1e-3)
+
+    history = trainer._load_history(trainer._history_paths())
+    assert list(history[0][1].columns) == list(compact.columns)
+    np.testing.assert_allclose(history[0][1]["virtual_power"], compact["virtual_power"], rtol=1e-6, atol=1e-3)
+    combined = trainer._concat_history(history)
+    assert isinstance(combined["activity_id"].dtype, pd.CategoricalDtype)
+    assert list(combined["activity_id"].cat.categories) == ["1.tcx", "12.tcx"]
+
+    trainer.fit()
+    stored = HistoryStore.for_folder(str(tmp_path)).read()
+    assert "activity_id" not in stored.columns
+    assert stored["drift"].dtype == np.float32
+
+
+def _peak_memory(action):
+    tracemalloc.start()
+    try:
+        action()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def _biking_history(folder):
+    for name in ["1", "11", "12", "19", "2", "4", "5", "9"]:
+        shutil.copy(f"tests/data/{name}.tcx", folder / f"{name}.tcx")
+    # Warm the frame cache so the measurements below are not dominated by XML parsing
+    trainer = ContextTrainer(history_folder=str(folder))
+    trainer._load_history(trainer._history_paths())
+
+
+#history is ingested in bounded chunks, so compact mode holds less at peak than the full schema
+def test_compact_history_load_peak_memory(tmp_path):
+    _biking_history(tmp_path)
+    peaks = {}
+    for compact in (False, True):
+        trainer = ContextTrainer(history_folder=str(tmp_path), compact=compact, chunk_size=2)
+        peaks[compact] = _peak_memory(lambda: trainer._load_history(trainer._history_paths()))
+    assert peaks[True] < peaks[False]
+
+
+#compact mode at least halves the peak memory of a full fit
+def test_compact_fit_peak_memory(tmp_path):
+    _biking_history(tmp_path)
+    peaks = {}
+    for compact in (False, True):
+        trainer = ContextTrainer(history_folder=str(tmp_path), compact=compact, backend="linear")
+        peaks[compact] = _peak_memory(lambda: trainer.fit(force=True))
+    assert peaks[True] <= peaks[False] / 2
+
+
+#weather is columnar: constant weather broadcasts lazily and records convert once into arrays
+def test_weather_series_columns():
+    parser = DataParser(weather_api_key=None)
+    act, weather = parser.parse_file("tests/data/12.tcx", is_training=True)
+    assert isinstance(weather, WeatherSeries)
+    assert np.ndim(weather.columns["temp"]) == 0
+    assert weather[0] == {"temp": 20, "wspd": 0, "wdir": 0, "hum": 20}
+
+    records = [SimpleNamespace(temperature=25.0, wind_speed=18.0, wind_direction=90.0, humidity=60.0)] * len(weather)
+    from_objects = WeatherSeries.from_records(records)
+    np.testing.assert_array_equal(from_objects["wspd"], np.full(len(weather), 18.0))
+
+    cleaner = DataCleaner(parser)
+    df = cleaner.to_dataframe(act, from_objects)
+    assert (df["temp"] == 25.0).all()
+    assert np.allclose(df["wind_speed_mps"], 5.0)
+    pd.testing.assert_frame_equal(cleaner.to_dataframe(act, list(from_objects)), df)
+
+
+#batch physics over concatenated rides matches the per-ride path without leaking across ride boundaries
+def test_batch_physics_matches_per_ride():
+    parser = DataParser(weather_api_key=None)
+    cleaner = DataCleaner(parser)
+    engine = PhysicsEngine()
+    frames = [cleaner.to_dataframe(*parser.parse_file(f"tests/data/{name}.tcx", is_training=True)) for name in (12, 19, 1)]
+    frames[0].loc[3:6, "ele"] = np.nan
+    frames[1].loc[0:2, "lon"] = np.nan
+
+    expected = pd.concat([engine.calculate_virtual_power(df.copy()) for df in frames], ignore_index=True)
+    history = engine.calculate_history([df.copy() for df in frames])
+
+    for col in PhysicsEngine.batch_outputs:
+        np.testing.assert_allclose(history[col], expected[col], rtol=1e-12, atol=1e-12, equal_nan=True)
+
+    with pytest.raises(ValueError):
+        engine.batch_virtual_power(frames[0], [0, len(frames[0]) - 1])
+
+
+#streaming physics over random chunks is bit-identical to the batch kernel on the whole ride
+def test_streaming_physics_matches_batch():
+    parser = DataParser(weather_api_key=None)
+    df = DataCleaner(parser).to_dataframe(*parser.parse_file("tests/data/12.tcx", is_training=True))
+    df.loc[0:4, "lat"] = np.nan
+    df.loc[50:60, "ele"] = np.nan
+    df.loc[len(df) - 2:, "lon"] = np.nan
+
+    engine = PhysicsEngine()
+    batch = engine.calculate_history([df.copy()])
+
+    rng = np.random.default_rng(6)
+    stream = StreamingPhysics(engine)
+    parts, start = [], 0
+    while start < len(df):
+        size = int(rng.integers(1, 25))
+        parts.append(stream.push(df.iloc[start:start + size]))
+        start += size
+    parts.append(stream.flush())
+    streamed = pd.concat([p for p in parts if len(p)], ignore_index=True)
+
+    assert len(stream._context) == 0
+    pd.testing.assert_frame_equal(streamed[batch.columns], batch, check_exact=True)
+
+
+#weather is fetched once per (tile, hour), persisted, and served from the cache on repeated parses
+def test_weather_cache_with_local_provider(tmp_path):
+    csv_path = tmp_path / "weather.csv"
+    csv_path.write_text("time,temp,wspd,wdir,hum\n2000-01-01T00:00:00,14.5,12.0,270,65\n", encoding="utf-8")
+
+    class CountingProvider(LocalWeatherProvider):
+        calls = []
+
+        def fetch(self, lat, lon, hour):
+            self.calls.append((lat, lon, hour))
+            return super().fetch(lat, lon, hour)
+
+    provider = CountingProvider(str(csv_path))
+    cache = ActivityCache(str(tmp_path / "cache"))
+    parser = DataParser(cache=cache, weather_provider=provider)
+    assert not parser.uses_weather(is_training=True)
+
+    act, weather = parser.parse_file("tests/data/1.tcx")
+    assert len(weather) == len(act["timestamps"])
+    assert weather["temp"][0] == pytest.approx(14.5)
+    keys = {weather_key(lat, lon, hour)[0] for lat, lon, hour in provider.calls}
+    assert len(keys) == len(provider.calls) > 0
+
+    # Nothing is written until the batch is saved; then the same ride again, and a fresh
+    # parser over the persisted cache, need no fetches
+    weather_path = os.path.join(cache.cache_dir, "weather.json")
+    assert not os.path.exists(weather_path)
+    parser.save_weather()
+    fetched = len(provider.calls)
+    parser.parse_file("tests/data/1.tcx")
+    DataParser(cache=cache, weather_provider=provider).parse_file("tests/data/1.tcx")
+    assert len(provider.calls) == fetched
+    assert len(WeatherCache(weather_path)) == fetched
+
+
+#bulk prefetch fetches each (tile, hour) once through a rate-limited pool, retrying server errors
+def test_weather_prefetch_against_mock_server(tmp_path):
+    requests = Counter()
+    lock = threading.Lock()
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            query = urllib.parse.parse_qs(urllib.parse.urlsplit(self.path).query)
+            key = (query["locations"][0], query["startDateTime"][0])
+            with lock:
+                requests[key] += 1
+                first_failure = len(requests) == 1 and requests[key] == 1
+            status = 503 if first_failure else 200
+            body = {"location": {"values": [{"temp": 18.0, "wspd": 9.0, "wdir": 90.0, "humidity": 55.0}]}}
+            payload = json.dumps(body).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        provider = VisualCrossingProvider("test", host=f"127.0.0.1:{server.server_port}", https=False)
+        trainer = ContextTrainer("tests/data", cache_dir=str(tmp_path / "cache"), weather_provider=provider)
+        stats = trainer.prefetch_weather(max_workers=4, rate_limit=500, backoff=0.01)
+
+        assert stats["fetched"] == stats["needed"] == len(requests) > 1
+        assert stats["failed"] == 0
+        assert sum(requests.values()) == len(requests) + 1  # one retried request
+
+        total = sum(requests.values())
+        assert trainer.prefetch_weather()["fetched"] == 0
+        act, weather = trainer.parser.parse_file("tests/data/1.tcx")
+        assert sum(requests.values()) == total
+        assert weather["temp"][0] == pytest.approx(18.0)
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+#weather interpolation is linear in time, circular for wind direction, clamps outside the samples and bridges missing ones
+def test_interpolate_weather():
+    hours = np.array(["2024-05-01T10", "2024-05-01T11", "2024-05-01T12"], dtype="datetime64[h]")
+    samples = {"temp": [10.0, 16.0, 13.0], "wspd": [0.0, 30.0, None], "wdir": [350.0, 10.0, 90.0], "hum": [40, 60, 80]}
+    timestamps = np.datetime64("2024-05-01T09:30:00") + np.arange(0, 4 * 3600, 60).astype("timedelta64[s]")
+
+    weather = interpolate_weather(hours, samples, timestamps)
+    t = timestamps.astype("datetime64[s]").astype(np.int64)
+    h = hours.astype("datetime64[s]").astype(np.int64)
+
+    assert len(weather) == len(timestamps)
+    np.testing.assert_allclose(weather["temp"], np.interp(t, h, samples["temp"]))
+    np.testing.assert_allclose(weather["wspd"], np.interp(t, h[:2], [0.0, 30.0]))
+    np.testing.assert_allclose(weather["hum"], np.interp(t, h, samples["hum"]))
+
+    #a field the provider never reported is neutral, not 0
+    missing = interpolate_weather(hours, {**samples, "temp": [None, np.nan, None]}, timestamps)
+    np.testing.assert_allclose(missing["temp"], WeatherSeries.neutral["temp"])
+
+    wdir = pd.Series(weather["wdir"], index=pd.to_datetime(timestamps))
+    assert wdir.iloc[0] == pytest.approx(350.0)
+    assert min(wdir["2024-05-01 10:30"], 360 - wdir["2024-05-01 10:30"]) == pytest.approx(0.0, abs=1e-9)
+    assert wdir["2024-05-01 11:30"] == pytest.approx(50.0)
+    assert wdir.iloc[-1] == pytest.approx(90.0)
+
+
+#summary-only scan of TCX files matches the full timeframes path, also for out-of-order layouts and from the cache
+def test_file_summaries_match_full_path(tmp_path):
+    files = sorted(os.path.join("tests/data", f) for f in os.listdir("tests/data") if f.endswith(".tcx"))
+    parser = DataParser(weather_api_key=None)
+    cleaner = DataCleaner()
+    full = cleaner.build_dashboard([(os.path.basename(f), parser.parse_tcx_file(f)) for f in files])
+    fast = cleaner.build_dashboard_from_files(files)
+    pd.testing.assert_frame_equal(fast.reset_index(drop=True), full.reset_index(drop=True), rtol=1e-9)
+
+    # Distance written before altitude still reads the same
+
+    text = open(files[0], encoding="utf-8").read()
+    odd_file = tmp_path / os.path.basename(files[0])
+    odd_file.write_text(
+        re.sub(r"(<AltitudeMeters>[^<]*</AltitudeMeters>)(\s*)(<DistanceMeters>[^<]*</DistanceMeters>)", r"\3\2\1", text),
+        encoding="utf-8",
+    )
+    odd = cleaner.summarize_file(str(odd_file))
+    row = full.set_index("source_file").loc[odd_file.name]
+    assert odd["start_time"] == row["start_time"]
+    for key in ["duration_s", "distance_km", "avg_h_r", "avg_speed_mps", "trimp_bannister", "trimp_edwards", "z2_sec"]:
+        assert odd[key] == pytest.approx(row[key])
+
+    # Points out of time order or repeated are summarized like the sorted, de-duplicated ride
+
+    _, timestamps, h_r, dist_m = read_tcx_track(files[0])
+    shuffled = np.random.default_rng(3).permutation(len(timestamps))
+    shuffled = np.concatenate([shuffled, shuffled[:5]])
+    messy = cleaner.summarize_track(timestamps[shuffled], h_r[shuffled], dist_m[shuffled])
+    ordered = cleaner.summarize_track(timestamps, h_r, dist_m)
+    assert messy["start_time"] == ordered["start_time"]
+    for key in ["duration_s", "distance_km", "avg_h_r", "avg_speed_mps", "trimp_bannister", "trimp_edwards", "z2_sec"]:
+        assert messy[key] == pytest.approx(ordered[key])
+
+    # Like the full path, a ride without a Sport, or whose last Activity is not biking, has no summary
+    no_sport = tmp_path / "no_sport.tcx"
+    no_sport.write_text(re.sub(r'(<Activity\b[^>]*?)\s+Sport="[^"]*"', r"\1", text), encoding="utf-8")
+    assert parser.parse_tcx_file(str(no_sport)).activity_type is None
+    assert cleaner.summarize_file(str(no_sport)) is None
+    mixed = tmp_path / "mixed.tcx"
+    mixed.write_text(text.replace("</Activities>", '<Activity Sport="Running"><Id>x</Id></Activity></Activities>'), encoding="utf-8")
+    assert parser.parse_tcx_file(str(mixed)).activity_type == "Running"
+    assert cleaner.summarize_file(str(mixed)) is None
+
+    cached_cleaner = DataCleaner(DataParser(cache=ActivityCache(str(tmp_path / "cache"))))
+    first = cached_cleaner.file_summaries(files)
+    second = cached_cleaner.file_summaries(files)
+    pd.testing.assert_frame_equal(second, first)
+    pd.testing.assert_frame_equal(first, cleaner.file_summaries(files), rtol=1e-9)
+
+
+#gzip, bz2, and zip-archived TCX inputs are listed and parsed like the plain files, without temp files
+def test_compressed_tcx_sources(tmp_path):
+    raw = {name: open(f"tests/data/{name}", "rb").read() for name in ["1.tcx", "2.tcx", "11.tcx", "12.tcx"]}
+    (tmp_path / "1.tcx.gz").write_bytes(gzip.compress(raw["1.tcx"]))
+    (tmp_path / "2.tcx.bz2").write_bytes(bz2.compress(raw["2.tcx"]))
+    with zipfile.ZipFile(tmp_path / "bundle.zip", "w", compression=zipfile.ZIP_DEFLATED) as bundle:
+        bundle.writestr("11.tcx", raw["11.tcx"])
+        bundle.writestr("rides/12.tcx.gz", gzip.compress(raw["12.tcx"]))
+        bundle.writestr("notes.txt", "not a ride")
+
+    sources = list_tcx_sources(str(tmp_path))
+    assert [source_name(s) for s in sources] == ["1.tcx.gz", "2.tcx.bz2", "bundle.zip/11.tcx", "bundle.zip/rides/12.tcx.gz"]
+    assert all(source_exists(s) for s in sources)
+    assert not source_exists(str(tmp_path / "bundle.zip" / "missing.tcx"))
+
+    cleaner = DataCleaner()
+    for source, name in zip(sources, raw):
+        plain, packed = read_tcx(f"tests/data/{name}"), read_tcx(source)
+        np.testing.assert_array_equal(packed.timestamps, plain.timestamps)
+        np.testing.assert_array_equal(packed.heartrates, plain.heartrates)
+        assert packed.distance == plain.distance
+        assert cleaner.summarize_file(source, source_file=name) == cleaner.summarize_file(f"tests/data/{name}")
+
+    trainer = ContextTrainer(str(tmp_path), cache_dir=str(tmp_path / "cache"))
+    history = trainer._load_history(trainer._history_paths())
+    assert [source_name(path) for path, _ in history] == [source_name(s) for s in sources]
+    assert len(set(trainer.cache.content_key(s) for s in sources)) == len(sources)
+    assert ActivityCache(str(tmp_path / "cache")).prune() == 0
+    assert trainer._training_key(sources) == trainer._training_key(trainer._history_paths())
+
+
+#after an update, fit() still retrains when the folder holds a ride that was never trained
+def test_update_fingerprint_covers_only_trained_rides(tmp_path, monkeypatch):
+    for name in ["1.tcx", "12.tcx"]:
+        (tmp_path / name).write_bytes(open(os.path.join("tests/data", name), "rb").read())
+    ContextTrainer(history_folder=str(tmp_path)).fit()
+
+    for name in ["19.tcx", "2.tcx"]:
+        (tmp_path / name).write_bytes(open(os.path.join("tests/data", name), "rb").read())
+    trainer = ContextTrainer(history_folder=str(tmp_path))
+    trainer.update(["19.tcx"], n_new_trees=5)
+    assert HistoryStore.for_folder(str(tmp_path)).activity_ids() == ["1.tcx", "12.tcx", "19.tcx"]
+
+    retrained = []
+    refit = ContextTrainer(history_folder=str(tmp_path))
+    train = refit.model.train
+    monkeypatch.setattr(refit.model, "train", lambda df: retrained.append(1) or train(df))
+    refit.fit()
+    assert retrained
+    assert HistoryStore.for_folder(str(tmp_path)).activity_ids() == ["1.tcx", "12.tcx", "19.tcx", "2.tcx"]
+
+
+#updating under another backend than the saved model's refits instead of warm-starting the saved model
+def test_update_refits_on_backend_mismatch(tmp_path):
+    for name in ["1.tcx", "12.tcx"]:
+        (tmp_path / name).write_bytes(open(os.path.join("tests/data", name), "rb").read())
+    ContextTrainer(history_folder=str(tmp_path)).fit()
+
+    (tmp_path / "19.tcx").write_bytes(open("tests/data/19.tcx", "rb").read())
+    trainer = ContextTrainer(history_folder=str(tmp_path), backend="linear")
+    trainer.update(["19.tcx"])
+
+    assert trainer.model.backend == "linear"
+    assert not hasattr(trainer.model.model, "estimators_")
+    assert HistoryStore.for_folder(str(tmp_path)).activity_ids() == ["1.tcx", "12.tcx", "19.tcx"]
+
+
+#time_delta is deprecated: passing it warns and nothing keeps it
+def test_time_delta_deprecated(tmp_path):
+    with pytest.warns(DeprecationWarning):
+        parser = DataParser(time_delta=2)
+    assert not hasattr(parser, "time_delta")
+    with pytest.warns(DeprecationWarning):
+        ContextTrainer(history_folder=str(tmp_path), time_delta=2, use_cache=False)